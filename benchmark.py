@@ -0,0 +1,181 @@
+from graph import Graph
+from shop import Shop
+from shophashtable import ShopHashTable
+from shopheap import ShopHeap
+from shopstore import ShopStore
+import argparse
+import csv
+import json
+import math
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+LOCATIONS = ["North", "South", "East", "West", "Center"]
+
+
+def _rating(rng, distribution):
+    # Ratings between 1 and 5, rounded to half stars
+    if distribution == "uniform":
+        value = rng.uniform(1, 5)
+    elif distribution == "normal":
+        value = rng.gauss(3.5, 0.8)
+    elif distribution == "skewed":
+        value = 5 - rng.expovariate(1.5)
+    else:
+        raise ValueError(f"Unknown rating distribution: {distribution}")
+    return min(5, max(1, round(value * 2) / 2))
+
+
+def generate_mall(size, layout="grid", floors=3, categories=20, ratings="uniform", degree=4, seed=0):
+    # Build a synthetic mall of `size` shops. Returns (shops, edges) where edges are
+    # (source, destination, walking distance) tuples.
+    #   grid        one floor laid out on a square grid, 10 units between neighbours
+    #   multifloor  `floors` stacked grids joined by escalators every few shops
+    #   random      random corridors (about `degree` per shop) over a connecting chain,
+    #               each at least as long as the straight line between its shops
+    rng = random.Random(seed)
+    if layout not in ("grid", "multifloor", "random"):
+        raise ValueError(f"Unknown layout: {layout}")
+    if size < 1:
+        raise ValueError("A mall needs at least one shop.")
+
+    floors = floors if layout == "multifloor" else 1
+    per_floor = math.ceil(size / floors)
+    width = math.ceil(math.sqrt(per_floor))
+    shops = []
+    for number in range(size):
+        floor, cell = divmod(number, per_floor)
+        row, col = divmod(cell, width)
+        shops.append(Shop(number, f"Shop{number}", f"Category{rng.randrange(categories)}",
+                          rng.choice(LOCATIONS), _rating(rng, ratings), col * 10.0, row * 10.0))
+
+    edges = []
+    if layout == "random":
+        def corridor(a, b):
+            # Corridors wind, but never beat the straight line between the shops,
+            # so the A* distance heuristic stays admissible
+            straight = math.hypot(shops[a].x - shops[b].x, shops[a].y - shops[b].y)
+            return max(10, math.ceil(straight * rng.uniform(1, 1.5)))
+
+        for number in range(1, size):
+            edges.append((number - 1, number, corridor(number - 1, number)))
+        seen = {(a, b) for a, b, _ in edges}
+        for _ in range(max(0, size * degree // 2 - (size - 1))):
+            a, b = rng.randrange(size), rng.randrange(size)
+            key = (min(a, b), max(a, b))
+            if a != b and key not in seen:
+                seen.add(key)
+                edges.append((a, b, corridor(a, b)))
+        return shops, edges
+
+    for number in range(size):
+        floor, cell = divmod(number, per_floor)
+        row, col = divmod(cell, width)
+        if col + 1 < width and cell + 1 < per_floor and number + 1 < size:
+            edges.append((number, number + 1, 10))
+        if cell + width < per_floor and number + width < size:
+            edges.append((number, number + width, 10))
+        # Escalators connect the same cell on neighbouring floors
+        if cell % 7 == 0 and floor + 1 < floors and number + per_floor < size:
+            edges.append((number, number + per_floor, 30))
+    return shops, edges
+
+
+def write_csv(shops, edges, directory):
+    # Write shops.csv and edges.csv in the format read by Graph.load_csv
+    shops_path = os.path.join(directory, "shops.csv")
+    edges_path = os.path.join(directory, "edges.csv")
+    with open(shops_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["number", "name", "category", "location", "rating", "x", "y"])
+        for shop in shops:
+            writer.writerow([shop.number, shop.name, shop.category, shop.location, shop.rating, shop.x, shop.y])
+    with open(edges_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["source", "destination", "weight"])
+        writer.writerows(edges)
+    return shops_path, edges_path
+
+
+def _time(operation, arguments):
+    # Run operation once per argument tuple; returns (total seconds, count)
+    start = time.perf_counter()
+    for args in arguments:
+        operation(*args)
+    return time.perf_counter() - start, len(arguments)
+
+
+def run_benchmark(size, layout="grid", queries=20, seed=0, **mall_options):
+    # Time the main operations on one synthetic mall; returns a JSON-serialisable dict
+    rng = random.Random(seed)
+    shops, edges = generate_mall(size, layout, seed=seed, **mall_options)
+    timings = {}
+
+    with tempfile.TemporaryDirectory() as directory:
+        shops_path, edges_path = write_csv(shops, edges, directory)
+        graph, shop_table, shop_heap = Graph(), ShopHashTable(), ShopHeap()
+        timings["load"] = _time(graph.load_csv, [(shops_path, edges_path, shop_table, shop_heap)])
+
+    numbers = list(graph.shops)
+    pairs = [(rng.choice(numbers), rng.choice(numbers)) for _ in range(queries)]
+    categories = list(shop_table.table)
+    timings["bfs"] = _time(graph.bfs, pairs)
+    timings["dfs"] = _time(graph.dfs, pairs)
+    timings["shortest_path"] = _time(graph.shortest_path, pairs)
+    timings["shortest_path_astar"] = _time(graph.shortest_path, [pair + ("astar",) for pair in pairs])
+    timings["hashtable_search"] = _time(lambda category: list(shop_table.iter_search(category)),
+                                        [(rng.choice(categories),) for _ in range(queries)])
+    edited = [graph.shops[number] for number in rng.sample(numbers, min(queries, len(numbers)))]
+    timings["hashtable_update"] = _time(shop_table.update, [(shop, shop) for shop in edited])
+    timings["heap_rebuild"] = _time(shop_heap.rebuild_heap, [(list(graph.shops.values()),)])
+    store = ShopStore(graph, shop_table, shop_heap)
+    timings["name_index"] = _time(lambda: store.name_index, [()])
+    names = [graph.shops[number].name for number in rng.sample(numbers, min(queries, len(numbers)))]
+    timings["autocomplete"] = _time(store.autocomplete, [(name[:max(1, len(name) - 2)],) for name in names])
+    # Misspell each name by replacing its last letter
+    timings["find_by_name"] = _time(store.find_by_name, [(name[:-1] + "x",) for name in names])
+    timings["remove_vertex"] = _time(graph.remove_vertex, [(shop.number,) for shop in edited])
+
+    return {
+        "layout": layout,
+        "shops": size,
+        "edges": len(edges),
+        "seed": seed,
+        "python": platform.python_version(),
+        "results": {name: {"ops": count, "total_s": round(total, 6),
+                           "per_op_ms": round(total / count * 1000, 4) if count else None}
+                    for name, (total, count) in timings.items()},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the graph, hash table and heap on synthetic malls.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--layouts", nargs="+", default=["grid", "multifloor", "random"])
+    parser.add_argument("--floors", type=int, default=3)
+    parser.add_argument("--categories", type=int, default=20)
+    parser.add_argument("--ratings", default="uniform", choices=["uniform", "normal", "skewed"])
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="-", help="JSON-lines results file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    out = sys.stdout if args.output == "-" else open(args.output, "a")
+    try:
+        for layout in args.layouts:
+            for size in args.sizes:
+                result = run_benchmark(size, layout, args.queries, args.seed, floors=args.floors,
+                                       categories=args.categories, ratings=args.ratings)
+                out.write(json.dumps(result) + "\n")
+                out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+from shop import Shop
+import datetime
+import metrics
+
+# Commands are dicts such as {"op": "route", "source": 1, "destination": 5}.
+# They are shared by the query server and the batch mode of main.py.
+# Operations that change the store; everything else only reads.
+WRITE_OPS = {"add_shop", "update_shop", "delete_shop", "add_connection", "delete_connection", "set_congestion"}
+
+
+def shop_to_dict(shop):
+    return {"number": shop.number, "name": shop.name, "category": shop.category,
+            "location": shop.location, "rating": shop.rating, "x": shop.x, "y": shop.y}
+
+
+def is_write(command):
+    # metrics also changes global state when it switches recording on or off
+    op = command.get("op")
+    return op in WRITE_OPS or (op == "metrics" and "enable" in command)
+
+
+def _field(command, name):
+    # A required field; a missing one is the client's error, unlike a KeyError
+    # raised inside a handler, which is a bug
+    if name not in command:
+        raise ValueError(f"Missing field: {name}")
+    return command[name]
+
+
+def _add_shop(store, command):
+    shop = Shop(int(_field(command, "number")), _field(command, "name"), _field(command, "category"),
+                _field(command, "location"), _field(command, "rating"), command.get("x"), command.get("y"))
+    store.add(shop)
+    return {"shop": shop_to_dict(shop)}
+
+
+def _update_shop(store, command):
+    changes = {key: value for key, value in command.items() if key not in ("op", "id", "number")}
+    shop = store.update(int(_field(command, "number")), **changes)
+    return {"shop": shop_to_dict(shop)}
+
+
+def _delete_shop(store, command):
+    shop = store.remove(int(_field(command, "number")))
+    return {"shop": shop_to_dict(shop)}
+
+
+def _add_connection(store, command):
+    store.connect(int(_field(command, "source")), int(_field(command, "destination")), command.get("weight", 1))
+    return {}
+
+
+def _delete_connection(store, command):
+    store.disconnect(int(_field(command, "source")), int(_field(command, "destination")))
+    return {}
+
+
+def _set_congestion(store, command):
+    store.set_congestion(int(_field(command, "source")), int(_field(command, "destination")),
+                         _field(command, "multipliers"))
+    return {}
+
+
+def _moment(value):
+    # "at" is a POSIX timestamp, an ISO date and time, or a time of day such as "17:30"
+    if isinstance(value, (int, float)):
+        return value
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        return datetime.time.fromisoformat(value)
+
+
+def _get_shop(store, command):
+    return {"shop": shop_to_dict(store.get(int(_field(command, "number"))))}
+
+
+def _route(store, command):
+    # method is one of dfs, bfs, bidirectional, dijkstra (default) or astar.
+    # With "at", the route is the quickest at that time given the congestion profiles.
+    graph = store.graph
+    source, destination = int(_field(command, "source")), int(_field(command, "destination"))
+    method = command.get("method", "dijkstra")
+    if "at" in command:
+        when = _moment(command["at"])
+        path = graph.shortest_path_at(source, destination, when)
+        return {"path": path, "distance": graph.path_cost(path) if path else None,
+                "walking_time": graph.path_cost_at(path, when) if path else None}
+    if method == "dfs":
+        path = graph.dfs(source, destination)
+    elif method == "bfs":
+        path = graph.bfs(source, destination)
+    else:
+        path = graph.shortest_path(source, destination, method)
+    return {"path": path, "distance": graph.path_cost(path) if path else None}
+
+
+def _nearest(store, command):
+    results = store.nearest(int(_field(command, "source")), _field(command, "category"), int(command.get("k", 1)),
+                            command.get("method", "dijkstra"))
+    return {"shops": [dict(shop_to_dict(store.get(number)), distance=distance, path=path)
+                      for number, distance, path in results]}
+
+
+def _search(store, command):
+    shops = store.shop_table.iter_search(_field(command, "category"), command.get("offset", 0), command.get("limit"),
+                                         command.get("sort_key"), command.get("reverse", False))
+    return {"shops": [shop_to_dict(shop) for shop in shops]}
+
+
+def _search_name(store, command):
+    # Autocomplete on a name prefix, or typo-tolerant lookup with "fuzzy": true
+    limit = int(command.get("limit", 10))
+    if command.get("fuzzy", False):
+        shops = store.find_by_name(_field(command, "text"), limit)
+    else:
+        shops = store.autocomplete(_field(command, "text"), limit)
+    return {"shops": [shop_to_dict(shop) for shop in shops]}
+
+
+def _top_rated(store, command):
+    shops = store.shop_heap.top_k(int(command.get("k", 10)), command.get("category"))
+    return {"shops": [shop_to_dict(shop) for shop in shops]}
+
+
+def _metrics(store, command):
+    # Instrumentation snapshot; {"enable": true/false} switches recording on or off first
+    if command.get("enable") is True and metrics.recorder is None:
+        metrics.enable()
+    elif command.get("enable") is False:
+        metrics.disable()
+    return {"metrics": metrics.snapshot()}
+
+
+HANDLERS = {
+    "add_shop": _add_shop,
+    "update_shop": _update_shop,
+    "delete_shop": _delete_shop,
+    "add_connection": _add_connection,
+    "delete_connection": _delete_connection,
+    "set_congestion": _set_congestion,
+    "get_shop": _get_shop,
+    "route": _route,
+    "nearest": _nearest,
+    "search": _search,
+    "search_name": _search_name,
+    "top_rated": _top_rated,
+    "metrics": _metrics,
+}
+
+
+def execute(store, command):
+    # Run one command against a ShopStore. Returns {"ok": True, ...results} or
+    # {"ok": False, "error": message}; an "id" in the command is echoed back.
+    # Only invalid commands (ValueError, TypeError) become error responses; any
+    # other exception is a bug and propagates to the caller.
+    response = {"id": command["id"]} if isinstance(command, dict) and "id" in command else {}
+    try:
+        if not isinstance(command, dict):
+            raise ValueError("A command must be a JSON object.")
+        handler = HANDLERS.get(command.get("op"))
+        if handler is None:
+            raise ValueError(f"Unknown operation: {command.get('op')}")
+        response.update(handler(store, command))
+        response["ok"] = True
+    except (ValueError, TypeError) as e:
+        response.update(ok=False, error=str(e))
+    return response
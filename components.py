@@ -0,0 +1,123 @@
+class ComponentIndex:
+    def __init__(self, adj_list):
+        # Connected components of a Graph's adjacency list, kept in a union-find
+        # forest so that "is there any path?" costs O(log n) and never changes state:
+        # reads may run in several threads at once (see server.py), so all updates
+        # happen in the mutation hooks, which the graph only calls from writers.
+        # Adding vertices and edges merges components as it happens. A removal
+        # that may split a component first checks, with a bidirectional search
+        # over the adjacency list, whether the two sides are still linked; only a
+        # real split rebuilds the forest.
+        self.adj_list = adj_list
+        self.parent = {}
+        self.rank = {}
+        self.size = {}  # root -> number of shops in the component
+        self.count = 0
+        # Removed shops that are still interior nodes of the forest
+        self.ghosts = 0
+        self.rebuilds = 0
+
+    def __len__(self):
+        # Number of connected components
+        return self.count
+
+    def add(self, vertex):
+        if vertex in self.parent:
+            # The shop was removed earlier and is still linked into the forest as a
+            # ghost; the adjacency list already holds it again
+            self.rebuild()
+            return
+        self.parent[vertex] = vertex
+        self.rank[vertex] = 0
+        self.size[vertex] = 1
+        self.count += 1
+
+    def find(self, vertex):
+        # Root of the vertex's component. Union by rank keeps trees O(log n) deep,
+        # so no path compression is needed and lookups stay read-only.
+        parent = self.parent
+        while parent[vertex] != vertex:
+            vertex = parent[vertex]
+        return vertex
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return
+        if self.rank[a] < self.rank[b]:
+            a, b = b, a
+        elif self.rank[a] == self.rank[b]:
+            self.rank[a] += 1
+        self.parent[b] = a
+        self.size[a] += self.size.pop(b)
+        self.count -= 1
+
+    def component_size(self, vertex):
+        # Number of shops reachable from vertex, itself included
+        return self.size[self.find(vertex)]
+
+    def remove_vertex(self, vertex, neighbours):
+        # Call after the vertex and its edges are gone from the adjacency list.
+        # An isolated shop that is a root of rank 0 has no children and is simply
+        # dropped. An isolated shop still linked to ghosts of earlier removals
+        # cannot be unlinked on its own, so the forest is rebuilt. Otherwise it
+        # stays in the forest as a ghost unless its former neighbours have lost
+        # touch with each other.
+        if not neighbours:
+            if self.parent[vertex] != vertex or self.rank[vertex]:
+                self.rebuild()
+                return
+            del self.parent[vertex]
+            del self.rank[vertex]
+            del self.size[vertex]
+            self.count -= 1
+            return
+        self.size[self.find(vertex)] -= 1
+        self.ghosts += 1
+        first, *others = neighbours
+        if any(not self._linked(first, other) for other in others) or self.ghosts > len(self.adj_list):
+            self.rebuild()
+
+    def remove_edge(self, source, destination):
+        # Call after the edge is gone from the adjacency list
+        if not self._linked(source, destination):
+            self.rebuild()
+
+    def _linked(self, a, b):
+        # Bidirectional BFS over the adjacency list, always growing the smaller side.
+        # When a and b are no longer linked, the search ends once the smaller of the
+        # two pieces is exhausted.
+        seen_a, seen_b = {a}, {b}
+        frontier_a, frontier_b = [a], [b]
+        adj_list = self.adj_list
+        while frontier_a and frontier_b:
+            if len(frontier_a) > len(frontier_b):
+                frontier_a, frontier_b, seen_a, seen_b = frontier_b, frontier_a, seen_b, seen_a
+            next_frontier = []
+            for vertex in frontier_a:
+                for neighbour in adj_list[vertex]:
+                    if neighbour in seen_b:
+                        return True
+                    if neighbour not in seen_a:
+                        seen_a.add(neighbour)
+                        next_frontier.append(neighbour)
+            frontier_a = next_frontier
+        return False
+
+    def rebuild(self):
+        # Recompute every component from the adjacency list. The new forest is built
+        # aside and swapped in at the end.
+        rebuilt = ComponentIndex(self.adj_list)
+        for vertex in self.adj_list:
+            rebuilt.add(vertex)
+        for vertex, neighbours in self.adj_list.items():
+            for neighbour in neighbours:
+                rebuilt.union(vertex, neighbour)
+        self.parent, self.rank, self.size = rebuilt.parent, rebuilt.rank, rebuilt.size
+        self.count = rebuilt.count
+        self.ghosts = 0
+        self.rebuilds += 1
+
+    def connected(self, a, b):
+        # Whether a path exists between two shops of the graph
+        return a == b or self.find(a) == self.find(b)
@@ -0,0 +1,82 @@
+from array import array
+import math
+import time
+
+HOURS = 24
+
+
+def hour_of(when):
+    # Hour of the day (0-23) for a datetime/time, or a POSIX timestamp in local time
+    if hasattr(when, "hour"):
+        return when.hour
+    if isinstance(when, (int, float)):
+        return time.localtime(when).tm_hour
+    raise ValueError(f"Cannot tell the time of day from {when!r}")
+
+
+class CongestionProfiles:
+    def __init__(self):
+        # Hourly walking-time multipliers per corridor. All profiles share one flat
+        # array of doubles, HOURS slots per corridor, so a mall with many profiled
+        # corridors costs 8 bytes per hour instead of a Python list each.
+        # Corridors without a profile always have multiplier 1.
+        self.slots = {}  # (smaller shop number, larger shop number) -> slot index
+        self.values = array("d")
+        self.free = []  # slots of removed profiles, reused first
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __contains__(self, edge):
+        return self._key(*edge) in self.slots
+
+    @staticmethod
+    def _key(a, b):
+        return (a, b) if a <= b else (b, a)
+
+    @staticmethod
+    def check(multipliers):
+        # Validate a profile and return it as a list of floats
+        multipliers = [float(value) for value in multipliers]
+        if len(multipliers) != HOURS:
+            raise ValueError(f"A congestion profile needs {HOURS} hourly multipliers, got {len(multipliers)}.")
+        if not all(math.isfinite(value) and value > 0 for value in multipliers):
+            raise ValueError("Congestion multipliers must be positive numbers.")
+        return multipliers
+
+    def copy(self):
+        # Independent profiles with the same contents (one dict and one array copy)
+        profiles = CongestionProfiles()
+        profiles.slots = dict(self.slots)
+        profiles.values = array("d", self.values)
+        profiles.free = list(self.free)
+        return profiles
+
+    def set(self, a, b, multipliers):
+        multipliers = self.check(multipliers)
+        key = self._key(a, b)
+        slot = self.slots.get(key)
+        if slot is None:
+            if self.free:
+                slot = self.free.pop()
+            else:
+                slot = len(self.values) // HOURS
+                self.values.extend(multipliers)
+            self.slots[key] = slot
+        self.values[slot * HOURS:(slot + 1) * HOURS] = array("d", multipliers)
+
+    def get(self, a, b):
+        # The 24 multipliers of a corridor, or None when it has no profile
+        slot = self.slots.get(self._key(a, b))
+        if slot is None:
+            return None
+        return list(self.values[slot * HOURS:(slot + 1) * HOURS])
+
+    def discard(self, a, b):
+        slot = self.slots.pop(self._key(a, b), None)
+        if slot is not None:
+            self.free.append(slot)
+
+    def multiplier(self, a, b, hour):
+        slot = self.slots.get(self._key(a, b))
+        return 1.0 if slot is None else self.values[slot * HOURS + hour]
@@ -0,0 +1,410 @@
+from array import array
+from bisect import bisect_left
+from collections import deque
+from congestion import CongestionProfiles, HOURS, hour_of
+import heapq
+from itertools import islice
+import math
+
+
+def _narrow(values, typecode, wide):
+    # An array of typecode holding values, or of the wider typecode when one overflows
+    try:
+        return array(typecode, values)
+    except OverflowError:
+        return array(wide, values)
+
+
+class CSRGraph:
+    def __init__(self, numbers, offsets, neighbours, weights, shops, congestion=None):
+        # Read-only compressed-sparse-row graph.
+        # numbers[i] is the shop number of vertex i; the neighbours of vertex i are
+        # neighbours[offsets[i]:offsets[i + 1]] (vertex indexes) with matching
+        # walking distances in weights. Any sequence supporting indexing works, so
+        # the arrays may also be memoryviews over a mapped file. congestion holds the
+        # corridors' hourly multipliers (by shop number) for shortest_path_at.
+        if len(offsets) != len(numbers) + 1:
+            raise ValueError("offsets must have one entry more than numbers.")
+        if len(neighbours) != len(weights) or offsets[len(numbers)] != len(neighbours):
+            raise ValueError("neighbours and weights must cover every offset.")
+        self.numbers = numbers
+        self.offsets = offsets
+        self.neighbours = neighbours
+        self.weights = weights
+        self.shops = shops
+        self.congestion = congestion if congestion is not None else CongestionProfiles()
+        # Finding a shop's vertex needs no per-shop dict when numbers are in
+        # increasing order (as from_graph writes them): consecutive numbers map by
+        # subtraction and others by binary search. Any other order gets a dict.
+        n = len(numbers)
+        self.index = None
+        self.dense = n > 0 and numbers[n - 1] - numbers[0] == n - 1
+        if not all(a < b for a, b in zip(numbers, islice(numbers, 1, None))):
+            self.index = {number: i for i, number in enumerate(numbers)}
+            self.dense = False
+        # Component label of each vertex and, per label, the size of its component;
+        # computed on first use (the graph never changes)
+        self.labels = None
+        self.sizes = None
+
+    @classmethod
+    def from_graph(cls, graph):
+        # Build the CSR arrays from a mutable Graph, keeping its neighbour order.
+        # Vertices are numbered in shop number order, consecutive shop numbers are
+        # kept as a range, and the arrays use 32-bit items whenever every value fits
+        # (walking distances only when they survive the conversion exactly). The
+        # congestion profiles are copied, but the shops dict is shared with the graph,
+        # so freeze a graph you are done editing.
+        numbers = sorted(graph.adj_list)
+        n = len(numbers)
+        if n and numbers[-1] - numbers[0] == n - 1:
+            numbers = range(numbers[0], numbers[0] + n)
+        else:
+            numbers = _narrow(numbers, "i", "q")
+        index = {number: i for i, number in enumerate(numbers)}
+        offsets = array("q", [0])
+        neighbours = array("q")
+        weights = array("d")
+        for number in numbers:
+            for neighbour, weight in graph.adj_list[number].items():
+                neighbours.append(index[neighbour])
+                weights.append(weight)
+            offsets.append(len(neighbours))
+        del index
+        single = array("f", weights)
+        return cls(numbers, _narrow(offsets, "i", "q"), _narrow(neighbours, "i", "q"),
+                   single if single == weights else weights, graph.shops, graph.congestion.copy())
+
+    def thaw(self):
+        # Convert back into a mutable Graph
+        from graph import Graph
+        graph = Graph()
+        for number in self.numbers:
+            graph.add_vertex(self.shops[number])
+        for i, number in enumerate(self.numbers):
+            for j in range(self.offsets[i], self.offsets[i + 1]):
+                neighbour = self.numbers[self.neighbours[j]]
+                if neighbour not in graph.adj_list[number]:
+                    graph.add_edge(number, neighbour, self.weights[j])
+        for source, destination in self.congestion.slots:
+            graph.set_congestion(source, destination, self.congestion.get(source, destination))
+        return graph
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def edge_count(self):
+        # Number of undirected edges
+        return len(self.neighbours) // 2
+
+    def has_vertex(self, shop_number):
+        return self._find(shop_number) is not None
+
+    def neighbours_of(self, shop_number):
+        # Shop numbers adjacent to a shop, in insertion order
+        i = self._vertex(shop_number)
+        numbers = self.numbers
+        return [numbers[j] for j in self.neighbours[self.offsets[i]:self.offsets[i + 1]]]
+
+    def edge_weight(self, source, destination):
+        i = self._vertex(source)
+        target = self._find(destination)
+        for j in range(self.offsets[i], self.offsets[i + 1]):
+            if self.neighbours[j] == target:
+                return self.weights[j]
+        raise ValueError(f"No edge exists from Shop {source} to Shop {destination}")
+
+    def path_cost(self, path):
+        return sum(self.edge_weight(a, b) for a, b in zip(path, path[1:]))
+
+    def _find(self, shop_number):
+        # Vertex index of a shop number, or None when it is not in the graph
+        if self.index is not None:
+            return self.index.get(shop_number)
+        numbers = self.numbers
+        if not isinstance(shop_number, int) or not numbers:
+            return None
+        if self.dense:
+            i = shop_number - numbers[0]
+        else:
+            i = bisect_left(numbers, shop_number)
+        if 0 <= i < len(numbers) and numbers[i] == shop_number:
+            return i
+        return None
+
+    def _vertex(self, shop_number):
+        i = self._find(shop_number)
+        if i is None:
+            raise ValueError(f"Shop {shop_number} doesn't exist!")
+        return i
+
+    def _component_labels(self):
+        offsets, neighbours = self.offsets, self.neighbours
+        typecode = "i" if len(self.numbers) < 2 ** 31 else "q"
+        labels = array(typecode, [-1]) * len(self.numbers)
+        for root in range(len(self.numbers)):
+            if labels[root] != -1:
+                continue
+            labels[root] = root
+            stack = [root]
+            while stack:
+                vertex = stack.pop()
+                for neighbour in neighbours[offsets[vertex]:offsets[vertex + 1]]:
+                    if labels[neighbour] == -1:
+                        labels[neighbour] = root
+                        stack.append(neighbour)
+        sizes = array(typecode, [0]) * len(self.numbers)
+        for label in labels:
+            sizes[label] += 1
+        return labels, sizes
+
+    def _label(self, vertex):
+        if self.labels is None:
+            # sizes is assigned first, so readers that see labels also see sizes
+            labels, self.sizes = self._component_labels()
+            self.labels = labels
+        return self.labels[vertex]
+
+    def _same_component(self, start, end):
+        return self._label(start) == self._label(end)
+
+    def _component_size(self, vertex):
+        label = self._label(vertex)
+        return self.sizes[label]
+
+    def connected(self, start, end):
+        # Whether any route exists between two shops
+        return self._same_component(self._vertex(start), self._vertex(end))
+
+    def _build_path(self, prev_nodes, end):
+        if end not in prev_nodes:
+            return []
+        numbers = self.numbers
+        path = []
+        while end != -1:
+            path.append(numbers[end])
+            end = prev_nodes[end]
+        path.reverse()
+        return path
+
+    def dfs(self, start, end):
+        # Same traversal order as Graph.dfs, over vertex indexes
+        start, end = self._vertex(start), self._vertex(end)
+        if not self._same_component(start, end):
+            return []
+        offsets, neighbours = self.offsets, self.neighbours
+        stack = [(start, -1)]
+        prev_nodes = {}
+
+        while stack:
+            vertex, parent = stack.pop()
+            if vertex in prev_nodes:
+                continue
+            prev_nodes[vertex] = parent
+            if vertex == end:
+                break
+            for neighbour in neighbours[offsets[vertex]:offsets[vertex + 1]]:
+                if neighbour not in prev_nodes:
+                    stack.append((neighbour, vertex))
+
+        return self._build_path(prev_nodes, end)
+
+    def bfs(self, start, end):
+        start, end = self._vertex(start), self._vertex(end)
+        if not self._same_component(start, end):
+            return []
+        offsets, neighbours = self.offsets, self.neighbours
+        queue = deque([start])
+        prev_nodes = {start: -1}
+
+        while queue:
+            vertex = queue.popleft()
+            if vertex == end:
+                break
+            for neighbour in neighbours[offsets[vertex]:offsets[vertex + 1]]:
+                if neighbour not in prev_nodes:
+                    prev_nodes[neighbour] = vertex
+                    queue.append(neighbour)
+
+        return self._build_path(prev_nodes, end)
+
+    def _expand_level(self, frontier, prev_nodes, other_prev):
+        offsets, neighbours = self.offsets, self.neighbours
+        next_frontier = []
+        for vertex in frontier:
+            for neighbour in neighbours[offsets[vertex]:offsets[vertex + 1]]:
+                if neighbour not in prev_nodes:
+                    prev_nodes[neighbour] = vertex
+                    if neighbour in other_prev:
+                        return next_frontier, neighbour
+                    next_frontier.append(neighbour)
+        return next_frontier, None
+
+    def _bidirectional_bfs(self, start, end):
+        # Same meet-in-the-middle search as Graph._bidirectional_bfs
+        prev_forward = {start: -1}
+        prev_backward = {end: -1}
+        frontier_forward = [start]
+        frontier_backward = [end]
+        meet = start if start == end else None
+
+        while meet is None and frontier_forward and frontier_backward:
+            if len(frontier_forward) <= len(frontier_backward):
+                frontier_forward, meet = self._expand_level(frontier_forward, prev_forward, prev_backward)
+            else:
+                frontier_backward, meet = self._expand_level(frontier_backward, prev_backward, prev_forward)
+
+        if meet is None:
+            return []
+        path = self._build_path(prev_forward, meet)
+        vertex = prev_backward[meet]
+        while vertex != -1:
+            path.append(self.numbers[vertex])
+            vertex = prev_backward[vertex]
+        return path
+
+    def _distance_heuristic(self, end):
+        target = self.shops[self.numbers[end]]
+        if target.x is None or target.y is None:
+            return None
+        numbers, shops = self.numbers, self.shops
+
+        def heuristic(vertex):
+            shop = shops[numbers[vertex]]
+            if shop.x is None or shop.y is None:
+                return 0
+            return math.hypot(shop.x - target.x, shop.y - target.y)
+
+        return heuristic
+
+    def shortest_path(self, start, end, method="dijkstra"):
+        # Same methods as Graph.shortest_path
+        start, end = self._vertex(start), self._vertex(end)
+        if method not in ("dijkstra", "astar", "bidirectional"):
+            raise ValueError(f"Unknown routing method: {method}")
+        if not self._same_component(start, end):
+            return []
+        if method == "bidirectional":
+            return self._bidirectional_bfs(start, end)
+        heuristic = self._distance_heuristic(end) if method == "astar" else None
+
+        offsets, neighbours, weights = self.offsets, self.neighbours, self.weights
+        # Stale heap entries are skipped by distance rather than by a settled set, so
+        # shops without coordinates (heuristic 0) cannot make A* miss the best route
+        dist = {start: 0}
+        prev_nodes = {start: -1}
+        heap = [(heuristic(start) if heuristic else 0, 0, start)]
+
+        while heap:
+            _, base, vertex = heapq.heappop(heap)
+            if base > dist[vertex]:
+                continue
+            if vertex == end:
+                break
+            for j in range(offsets[vertex], offsets[vertex + 1]):
+                neighbour = neighbours[j]
+                cost = base + weights[j]
+                if cost < dist.get(neighbour, math.inf):
+                    dist[neighbour] = cost
+                    prev_nodes[neighbour] = vertex
+                    priority = cost + heuristic(neighbour) if heuristic else cost
+                    heapq.heappush(heap, (priority, cost, neighbour))
+
+        return self._build_path(prev_nodes, end)
+
+    def nearest(self, start, category, k=1, method="dijkstra", candidates=None):
+        # Same search and results as Graph.nearest
+        start = self._vertex(start)
+        if method not in ("dijkstra", "bfs"):
+            raise ValueError(f"Unknown routing method: {method}")
+        if k < 1:
+            raise ValueError("k must be positive.")
+
+        numbers, shops = self.numbers, self.shops
+        offsets, neighbours, weights = self.offsets, self.neighbours, self.weights
+        if isinstance(candidates, (list, tuple)):
+            candidates = set(candidates)
+        wanted = min(k, len(candidates)) if candidates is not None else k
+        reachable = self._component_size(start)
+        dist = {start: 0}
+        prev_nodes = {start: -1}
+        settled = set()
+        heap = [(0, start)]
+        found = []
+
+        while heap and len(found) < wanted and len(settled) < reachable:
+            _, vertex = heapq.heappop(heap)
+            if vertex in settled:
+                continue
+            settled.add(vertex)
+            if candidates is not None:
+                matches = numbers[vertex] in candidates
+            else:
+                matches = shops[numbers[vertex]].category == category
+            if matches:
+                found.append(vertex)
+            base = dist[vertex]
+            for j in range(offsets[vertex], offsets[vertex + 1]):
+                neighbour = neighbours[j]
+                cost = base + (weights[j] if method == "dijkstra" else 1)
+                if cost < dist.get(neighbour, math.inf):
+                    dist[neighbour] = cost
+                    prev_nodes[neighbour] = vertex
+                    heapq.heappush(heap, (cost, neighbour))
+
+        return [(numbers[vertex], dist[vertex], self._build_path(prev_nodes, vertex)) for vertex in found]
+
+    def shortest_path_at(self, start, end, when):
+        # Same as Graph.shortest_path_at, without the route cache
+        start, end = self._vertex(start), self._vertex(end)
+        hour = hour_of(when)
+        if not self._same_component(start, end):
+            return []
+
+        numbers, offsets, neighbours, weights = self.numbers, self.offsets, self.neighbours, self.weights
+        slots, values = self.congestion.slots, self.congestion.values
+        dist = {start: 0}
+        prev_nodes = {start: -1}
+        settled = set()
+        heap = [(0, start)]
+
+        while heap:
+            _, vertex = heapq.heappop(heap)
+            if vertex in settled:
+                continue
+            if vertex == end:
+                break
+            settled.add(vertex)
+            base = dist[vertex]
+            number = numbers[vertex]
+            for j in range(offsets[vertex], offsets[vertex + 1]):
+                neighbour = neighbours[j]
+                weight = weights[j]
+                if slots:
+                    other = numbers[neighbour]
+                    slot = slots.get((number, other) if number <= other else (other, number))
+                    if slot is not None:
+                        weight *= values[slot * HOURS + hour]
+                cost = base + weight
+                if cost < dist.get(neighbour, math.inf):
+                    dist[neighbour] = cost
+                    prev_nodes[neighbour] = vertex
+                    heapq.heappush(heap, (cost, neighbour))
+
+        return self._build_path(prev_nodes, end)
+
+    def path_cost_at(self, path, when):
+        hour = hour_of(when)
+        return sum(self.edge_weight(a, b) * self.congestion.multiplier(a, b, hour) for a, b in zip(path, path[1:]))
+
+    def compare_paths(self, start, end):
+        # Graph.compare_paths only relies on has_vertex, dfs and bfs
+        from graph import Graph
+        return Graph.compare_paths(self, start, end)
+
+    # The frozen graph is read-only; mutations go through thaw()
+
+    def _read_only(self, *args, **kwargs):
+        raise ValueError("A frozen graph cannot be modified; call thaw() first.")
+
+    add_vertex = remove_vertex = add_edge = remove_edge = update_shop = _read_only
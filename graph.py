@@ -1,34 +1,112 @@
 from collections import deque
 from shop import Shop
+from components import ComponentIndex
+from congestion import CongestionProfiles, HOURS, hour_of
+from routecache import RouteCache
 import copy
+import csv
+import heapq
+import math
+import metrics
+import time
+
+class RouteTree:
+    def __init__(self, source, prev_nodes, dist, targets=None):
+        # Shortest-path tree from one source, as returned by Graph.routes_from.
+        # Paths are rebuilt on demand from the predecessor map instead of being stored.
+        # Distances are exact for the requested targets (or every vertex when targets is None).
+        self.source = source
+        self.prev_nodes = prev_nodes
+        self.dist = dist
+        self.targets = targets
+
+    def __contains__(self, target):
+        # Whether target was reached from the source
+        return target in self.prev_nodes
+
+    def distance(self, target):
+        # Distance from the source, or None if target is unreachable
+        return self.dist.get(target) if target in self.prev_nodes else None
+
+    def path(self, target):
+        # Path from the source to target, or [] if target is unreachable
+        if target not in self.prev_nodes:
+            return []
+        path = []
+        while target is not None:
+            path.append(target)
+            target = self.prev_nodes[target]
+        path.reverse()
+        return path
+
 
 class Graph:
     def __init__(self):
-        # Adjacency list representation of the graph
+        # Adjacency list representation of the graph: each shop maps to a dict of
+        # {neighbour: walking distance}, so membership tests and removals are O(1)
+        # while neighbours are still iterated in insertion order
         self.adj_list = {}
         # Stores information about each shop
         self.shops = {}
+        # Optional route cache, see enable_route_cache
+        self.route_cache = None
+        # Connected components, so searches between separate areas return at once
+        self.components = ComponentIndex(self.adj_list)
+        # Optional hourly walking-time multipliers per corridor, see set_congestion
+        self.congestion = CongestionProfiles()
+
+    def enable_route_cache(self, max_entries=4096, max_nodes=1_000_000, precompute=None):
+        # Cache bfs/shortest_path results; mutations invalidate only affected routes.
+        # precompute="bfs" or "dijkstra" fills a search tree for every source up front.
+        self.route_cache = RouteCache(max_entries, max_nodes)
+        if precompute:
+            self.route_cache.precompute(self, precompute)
+        return self.route_cache
+
+    def disable_route_cache(self):
+        self.route_cache = None
+
+    def freeze(self):
+        # Read-only compressed-sparse-row copy with the same search API, for large malls
+        from csrgraph import CSRGraph  # csrgraph imports Graph for thaw()
+        return CSRGraph.from_graph(self)
 
     def add_vertex(self, shop: Shop):
         # Check if the shop is already present
         if shop.number in self.adj_list:
             raise ValueError(f"Shop {shop.number} already exists!")
         # Add the shop to the adjacency list and shops dictionary
-        self.adj_list[shop.number] = []
+        self.adj_list[shop.number] = {}
         self.shops[shop.number] = shop
+        self.components.add(shop.number)
+        if self.route_cache is not None:
+            self.route_cache.on_add_vertex(shop.number)
 
     def remove_vertex(self, shop_number):
         # Remove the shop and its connections
         if shop_number not in self.adj_list:
             raise ValueError(f"Shop {shop_number} doesn't exist!")
-        for vertex in self.adj_list:
-            if shop_number in self.adj_list[vertex]:
-                self.adj_list[vertex].remove(shop_number)
-        self.adj_list.pop(shop_number)
+        # Only the removed shop's own neighbours hold a link back to it
+        for neighbour in self.adj_list[shop_number]:
+            del self.adj_list[neighbour][shop_number]
+            self.congestion.discard(shop_number, neighbour)
+        neighbours = list(self.adj_list.pop(shop_number))
         self.shops.pop(shop_number)
+        self.components.remove_vertex(shop_number, neighbours)
+        if self.route_cache is not None:
+            self.route_cache.on_remove_vertex(shop_number)
 
-    def add_edge(self, source, destination):
+    def add_edge(self, source, destination, weight=1):
         # Function to add a bidirectional edge between source and destination shops
+        # weight is the walking distance along the corridor (1 for plain hop counts)
+        self._check_new_edge(source, destination, weight)
+        self.adj_list[source][destination] = weight
+        self.adj_list[destination][source] = weight
+        if self.route_cache is not None:
+            self.route_cache.on_add_edge(source, destination, weight, self.components)
+        self.components.union(source, destination)
+        
+    def _check_new_edge(self, source, destination, weight):
         if source == destination:
             raise ValueError("A shop cannot be connected to itself.")
         if source not in self.adj_list:
@@ -37,9 +115,10 @@ class Graph:
             raise ValueError(f"Shop {destination} doesn't exist!")
         if destination in self.adj_list[source]:
             raise ValueError(f"A connection between Shop {source} and Shop {destination} already exists!")
-        self.adj_list[source].append(destination)
-        self.adj_list[destination].append(source)
-        
+        # NaN compares false with everything, so test for the valid range explicitly
+        if not (math.isfinite(weight) and weight > 0):
+            raise ValueError("Walking distance must be a positive number.")
+
     def remove_edge(self, source, dest):
         # Remove the edge between the source and destination shops
         if source not in self.adj_list:
@@ -48,16 +127,132 @@ class Graph:
             raise ValueError(f"Shop {dest} doesn't exist!")
         if dest not in self.adj_list[source]:
             raise ValueError(f"No edge exists from Shop {source} to Shop {dest}")
-        self.adj_list[source].remove(dest)
-        self.adj_list[dest].remove(source)
+        del self.adj_list[source][dest]
+        del self.adj_list[dest][source]
+        self.components.remove_edge(source, dest)
+        self.congestion.discard(source, dest)
+        if self.route_cache is not None:
+            self.route_cache.on_remove_edge(source, dest)
+
+    def set_congestion(self, source, destination, multipliers):
+        # Give a corridor 24 hourly walking-time multipliers (hour 0 first), used by
+        # shortest_path_at; multipliers=None removes the profile again
+        if destination not in self.adj_list.get(source, {}):
+            raise ValueError(f"No edge exists from Shop {source} to Shop {destination}")
+        if multipliers is None:
+            self.congestion.discard(source, destination)
+        else:
+            self.congestion.set(source, destination, multipliers)
+        if self.route_cache is not None:
+            self.route_cache.on_change_congestion(source, destination)
+
+    def load_csv(self, shops_path, edges_path, shop_table=None, shop_heap=None, chunk_size=10000):
+        # Bulk-load shops and connections from CSV files, streaming them in chunks.
+        # Each shop chunk is also batch-inserted into shop_table and shop_heap when
+        # they are given. Edges may carry a congestion profile in the columns h0 to
+        # h23 (left empty for corridors without one). Malformed rows are skipped
+        # and reported instead of aborting the load; returns the list of error messages.
+        errors = []
+
+        for columns, chunk in self._csv_chunks(shops_path, ("number", "name", "category", "location", "rating"), chunk_size, errors):
+            shops = []
+            for line, row in chunk:
+                try:
+                    shop = self._shop_from_row(columns, row)
+                    if shop.number in self.adj_list:
+                        raise ValueError(f"Shop {shop.number} already exists!")
+                except ValueError as e:
+                    errors.append(f"{shops_path} line {line}: {e}")
+                    continue
+                self.adj_list[shop.number] = {}
+                self.shops[shop.number] = shop
+                self.components.add(shop.number)
+                shops.append(shop)
+            if shop_table is not None:
+                shop_table.insert_many(shops)
+            if shop_heap is not None:
+                shop_heap.insert_many(shops)
+
+        for columns, chunk in self._csv_chunks(edges_path, ("source", "destination"), chunk_size, errors):
+            weight_column = columns.get("weight")
+            hour_columns = [columns.get(f"h{hour}") for hour in range(HOURS)]
+            if None in hour_columns:
+                hour_columns = None
+            for line, row in chunk:
+                try:
+                    source = int(row[columns["source"]])
+                    destination = int(row[columns["destination"]])
+                    weight = 1
+                    if weight_column is not None and row[weight_column].strip():
+                        weight = self._parse_number(row[weight_column])
+                    profile = None
+                    if hour_columns is not None and any(row[i].strip() for i in hour_columns):
+                        profile = self.congestion.check(row[i] for i in hour_columns)
+                    self._check_new_edge(source, destination, weight)
+                except ValueError as e:
+                    errors.append(f"{edges_path} line {line}: {e}")
+                    continue
+                self.adj_list[source][destination] = weight
+                self.adj_list[destination][source] = weight
+                self.components.union(source, destination)
+                if profile is not None:
+                    self.congestion.set(source, destination, profile)
+
+        if self.route_cache is not None:
+            self.route_cache.clear()
+        return errors
+
+    @staticmethod
+    def _csv_chunks(path, required, chunk_size, errors):
+        # Yield (column positions, [(line number, row), ...]) chunks from a CSV file
+        with open(path, newline="") as f:
+            reader = csv.reader(f)
+            header = next(reader, None)
+            if header is None:
+                errors.append(f"{path}: file is empty")
+                return
+            columns = {name.strip(): i for i, name in enumerate(header)}
+            missing = [name for name in required if name not in columns]
+            if missing:
+                errors.append(f"{path}: missing columns {', '.join(missing)}")
+                return
+
+            chunk = []
+            for row in reader:
+                if not row:
+                    continue
+                if len(row) != len(header):
+                    errors.append(f"{path} line {reader.line_num}: expected {len(header)} fields, got {len(row)}")
+                    continue
+                chunk.append((reader.line_num, row))
+                if len(chunk) >= chunk_size:
+                    yield columns, chunk
+                    chunk = []
+            if chunk:
+                yield columns, chunk
+
+    @staticmethod
+    def _parse_number(text):
+        # Keep whole numbers as ints so they print the same way as typed in the CSV
+        value = float(text)
+        return int(value) if value.is_integer() else value
 
+    def _shop_from_row(self, columns, row):
+        x = y = None
+        if "x" in columns and row[columns["x"]].strip():
+            x = float(row[columns["x"]])
+        if "y" in columns and row[columns["y"]].strip():
+            y = float(row[columns["y"]])
+        return Shop(int(row[columns["number"]]), row[columns["name"]], row[columns["category"]],
+                    row[columns["location"]], self._parse_number(row[columns["rating"]]), x, y)
 
     def update_shop(self, shop_number, attribute, new_value):
         # Update a specific attribute of a shop and return the old and new shop details
         if shop_number not in self.shops:
             raise ValueError(f"Shop {shop_number} doesn't exist!")
     
-        old_shop = copy.deepcopy(self.shops[shop_number])
+        # Shop fields are immutable values, so a shallow copy keeps the old details
+        old_shop = copy.copy(self.shops[shop_number])
     
         if attribute == "name":
             self.shops[shop_number].name = new_value
@@ -82,6 +277,35 @@ class Graph:
         # Checks if a particular shop exists in the graph
         return shop_number in self.adj_list
 
+    def connected(self, start, end):
+        # Whether any route exists between two shops, answered from the component index
+        if start not in self.adj_list:
+            raise ValueError(f"Shop {start} doesn't exist!")
+        if end not in self.adj_list:
+            raise ValueError(f"Shop {end} doesn't exist!")
+        return self.components.connected(start, end)
+
+    def edge_weight(self, source, destination):
+        # Walking distance of the edge between two shops
+        if destination not in self.adj_list.get(source, {}):
+            raise ValueError(f"No edge exists from Shop {source} to Shop {destination}")
+        return self.adj_list[source][destination]
+
+    def path_cost(self, path):
+        # Total walking distance along a path returned by one of the search methods
+        return sum(self.adj_list[a][b] for a, b in zip(path, path[1:]))
+
+    def _build_path(self, prev_nodes, end):
+        # Walk the predecessor links back from end; empty list if end was never reached
+        if end not in prev_nodes:
+            return []
+        path = []
+        while end is not None:
+            path.append(end)
+            end = prev_nodes[end]
+        path.reverse()
+        return path
+
 
     def dfs(self, start, end):
         # Depth-first search function to find a path from start to end
@@ -89,86 +313,556 @@ class Graph:
             raise ValueError(f"Shop {start} doesn't exist!")
         if end not in self.adj_list:
             raise ValueError(f"Shop {end} doesn't exist!")
+        if not self.components.connected(start, end):
+            return []
         
-        stack = [start]
-        visited = set()
-        prev_nodes = {start: None}
+        recorder = metrics.recorder
+        if recorder is not None:
+            started = time.perf_counter()
+        # Each stack entry remembers the vertex that pushed it, so a predecessor is
+        # only recorded when the vertex is actually visited
+        stack = [(start, None)]
+        prev_nodes = {}
     
         while stack:
-            vertex = stack.pop()
+            vertex, parent = stack.pop()
+            if vertex in prev_nodes:
+                continue
+            prev_nodes[vertex] = parent
             if vertex == end:
                 break
-            if vertex not in visited:
-                visited.add(vertex)
-                for neighbour in self.adj_list[vertex]:
-                    if neighbour not in visited:
-                        stack.append(neighbour)
-                        prev_nodes[neighbour] = vertex
+            for neighbour in self.adj_list[vertex]:
+                if neighbour not in prev_nodes:
+                    stack.append((neighbour, vertex))
     
-        if end not in prev_nodes:
-            return []  # Returning empty list instead of raising an error
-        
-        path = []
-        while end:
-            path.append(end)
-            end = prev_nodes[end]
-        path.reverse()
-        
+        path = self._build_path(prev_nodes, end)
+        if recorder is not None:
+            recorder.record_search("graph.dfs", started, len(prev_nodes), path)
         return path
-    
-    def bfs(self, start, end):
-        # Breadth-first search function to find the shortest path from start to end
+
+    def iter_dfs(self, start):
+        # Lazily yield (shop number, depth in the DFS tree) in the order dfs visits
+        # them, so callers can stop as soon as they have seen enough
+        if start not in self.adj_list:
+            raise ValueError(f"Shop {start} doesn't exist!")
+        stack = [(start, 0)]
+        visited = set()
+        while stack:
+            vertex, depth = stack.pop()
+            if vertex in visited:
+                continue
+            visited.add(vertex)
+            yield vertex, depth
+            for neighbour in self.adj_list[vertex]:
+                if neighbour not in visited:
+                    stack.append((neighbour, depth + 1))
+
+    def iter_bfs(self, start, max_hops=None):
+        # Lazily yield (shop number, hops from start) in breadth-first order, level by
+        # level; max_hops stops the traversal after that many levels
+        if start not in self.adj_list:
+            raise ValueError(f"Shop {start} doesn't exist!")
+        hops = {start: 0}
+        queue = deque([start])
+        while queue:
+            vertex = queue.popleft()
+            depth = hops[vertex]
+            yield vertex, depth
+            if depth == max_hops:
+                continue
+            for neighbour in self.adj_list[vertex]:
+                if neighbour not in hops:
+                    hops[neighbour] = depth + 1
+                    queue.append(neighbour)
+
+    def within_hops(self, start, end, max_hops):
+        # Whether end can be reached from start in at most max_hops steps,
+        # exploring only the shops that close to start
         if start not in self.adj_list:
             raise ValueError(f"Shop {start} doesn't exist!")
         if end not in self.adj_list:
             raise ValueError(f"Shop {end} doesn't exist!")
-        
+        if not self.components.connected(start, end):
+            return False
+        return any(vertex == end for vertex, _ in self.iter_bfs(start, max_hops))
+
+    def iddfs(self, start, end, max_depth=None):
+        # Iterative deepening: depth-first searches limited to 0, 1, 2, ... hops until
+        # end is found, so the path has the fewest hops while memory stays proportional
+        # to the depth reached. Gives up after max_depth hops (returns []) and stops
+        # early when a search is no longer cut short by its depth limit.
+        if start not in self.adj_list:
+            raise ValueError(f"Shop {start} doesn't exist!")
+        if end not in self.adj_list:
+            raise ValueError(f"Shop {end} doesn't exist!")
+        if not self.components.connected(start, end):
+            return []
+        if start == end:
+            return [start]
+
+        recorder = metrics.recorder
+        if recorder is not None:
+            started = time.perf_counter()
+        max_depth = len(self.adj_list) if max_depth is None else max_depth
+        path = []
+        visited = 0
+        for limit in range(1, max_depth + 1):
+            path, cut_off, expanded = self._depth_limited(start, end, limit)
+            visited += expanded
+            if path or not cut_off:
+                break
+        if recorder is not None:
+            recorder.record_search("graph.iddfs", started, visited, path)
+        return path
+
+    def _depth_limited(self, start, end, limit):
+        # One depth-first pass that never goes deeper than limit hops. A vertex is
+        # expanded again only when reached by a shorter route than before.
+        # Returns (path or [], whether the limit cut the search short, vertices expanded).
+        path = [start]
+        neighbours = [iter(self.adj_list[start])]
+        depths = {start: 0}
+        cut_off = False
+        expanded = 1
+        while neighbours:
+            depth = len(path)
+            for neighbour in neighbours[-1]:
+                if neighbour == end:
+                    path.append(end)
+                    return path, cut_off, expanded
+                if depths.get(neighbour, math.inf) <= depth:
+                    continue
+                if depth == limit:
+                    cut_off = True
+                    continue
+                depths[neighbour] = depth
+                path.append(neighbour)
+                neighbours.append(iter(self.adj_list[neighbour]))
+                expanded += 1
+                break
+            else:
+                neighbours.pop()
+                path.pop()
+        return [], cut_off, expanded
+    
+    def _bfs_tree(self, start, end, targets=None):
+        # Breadth-first search from start, stopping once end is dequeued (end=None
+        # explores the whole component) or, when a collection of targets is given,
+        # once all of them have been dequeued. Returns the predecessor and hop-count maps.
         queue = deque([start])
-        visited = {start}  # Start is marked visited as soon as it's added to the queue
+        dist = {start: 0}  # Start is marked visited as soon as it's added to the queue
         prev_nodes = {start: None}
+        remaining = set(targets) if targets is not None else None
     
         while queue:
             vertex = queue.popleft()
             if vertex == end:
                 break
+            if remaining is not None:
+                remaining.discard(vertex)
+                if not remaining:
+                    break
             for neighbour in self.adj_list[vertex]:
-                if neighbour not in visited:
-                    visited.add(neighbour)
+                if neighbour not in dist:
+                    dist[neighbour] = dist[vertex] + 1
                     queue.append(neighbour)
                     prev_nodes[neighbour] = vertex
     
-        if end not in prev_nodes:
-            return []  # Returning empty list instead of raising an error
-            
-        path = []
-        while end:
-            path.append(end)
-            end = prev_nodes[end]
-        path.reverse()
-    
+        return prev_nodes, dist
+
+    def bfs(self, start, end):
+        # Breadth-first search function to find the shortest path from start to end
+        if start not in self.adj_list:
+            raise ValueError(f"Shop {start} doesn't exist!")
+        if end not in self.adj_list:
+            raise ValueError(f"Shop {end} doesn't exist!")
+        if not self.components.connected(start, end):
+            return []
+
+        if self.route_cache is not None:
+            path = self.route_cache.get(start, end, "bfs")
+            if path is not None:
+                return path
+
+        recorder = metrics.recorder
+        if recorder is not None:
+            started = time.perf_counter()
+        prev_nodes, _ = self._bfs_tree(start, end)
+        path = self._build_path(prev_nodes, end)
+        if recorder is not None:
+            recorder.record_search("graph.bfs", started, len(prev_nodes), path)
+        if self.route_cache is not None:
+            self.route_cache.put(start, end, "bfs", path)
         return path
 
+    def _distance_heuristic(self, end):
+        # Straight-line distance to end, used by A*. Shops without coordinates
+        # fall back to 0. That never overestimates, but mixed with real distances
+        # it is not consistent either, so _dijkstra reopens a shop whenever it
+        # finds a cheaper route to it.
+        target = self.shops[end]
+        if target.x is None or target.y is None:
+            return None
 
-    #Use both DFS and BFS to find the path and return the shorter one
-    def shortest_path(self, start, end):
-        path_dfs = self.dfs(start, end)
-        path_bfs = self.bfs(start, end)
-    
-        if not path_dfs and not path_bfs:
+        def heuristic(vertex):
+            shop = self.shops[vertex]
+            if shop.x is None or shop.y is None:
+                return 0
+            return math.hypot(shop.x - target.x, shop.y - target.y)
+
+        return heuristic
+
+    def _dijkstra(self, start, end, heuristic=None, targets=None):
+        # Heap-based Dijkstra over the edge weights; with a heuristic this is A*.
+        # Stops at end, or once every vertex in targets is settled. Heap entries
+        # carry the distance they were pushed with and are skipped once a shorter one
+        # is known, so a vertex reached again more cheaply is expanded again.
+        dist = {start: 0}
+        prev_nodes = {start: None}
+        heap = [(heuristic(start) if heuristic else 0, 0, start)]
+        remaining = set(targets) if targets is not None else None
+
+        while heap:
+            _, cost, vertex = heapq.heappop(heap)
+            if cost > dist[vertex]:
+                continue
+            if vertex == end:
+                break
+            if remaining is not None:
+                remaining.discard(vertex)
+                if not remaining:
+                    break
+            for neighbour, weight in self.adj_list[vertex].items():
+                cost = dist[vertex] + weight
+                if cost < dist.get(neighbour, math.inf):
+                    dist[neighbour] = cost
+                    prev_nodes[neighbour] = vertex
+                    priority = cost + heuristic(neighbour) if heuristic else cost
+                    heapq.heappush(heap, (priority, cost, neighbour))
+
+        return prev_nodes, dist
+
+    def _expand_level(self, frontier, prev_nodes, other_prev):
+        # Expand one whole BFS level; stop as soon as a vertex seen by the other side is reached
+        next_frontier = []
+        for vertex in frontier:
+            for neighbour in self.adj_list[vertex]:
+                if neighbour not in prev_nodes:
+                    prev_nodes[neighbour] = vertex
+                    if neighbour in other_prev:
+                        return next_frontier, neighbour
+                    next_frontier.append(neighbour)
+        return next_frontier, None
+
+    def _bidirectional_bfs(self, start, end):
+        # Breadth-first search from both ends at once, always growing the smaller
+        # frontier. The first meeting vertex lies on a fewest-hops path.
+        prev_forward = {start: None}
+        prev_backward = {end: None}
+        frontier_forward = [start]
+        frontier_backward = [end]
+        meet = start if start == end else None
+
+        while meet is None and frontier_forward and frontier_backward:
+            if len(frontier_forward) <= len(frontier_backward):
+                frontier_forward, meet = self._expand_level(frontier_forward, prev_forward, prev_backward)
+            else:
+                frontier_backward, meet = self._expand_level(frontier_backward, prev_backward, prev_forward)
+
+        if meet is None:
             return []
-        elif not path_dfs:
-            return path_bfs
-        elif not path_bfs:
-            return path_dfs
+        path = self._build_path(prev_forward, meet)
+        vertex = prev_backward[meet]
+        while vertex is not None:
+            path.append(vertex)
+            vertex = prev_backward[vertex]
+        return path
+
+    # Find the cheapest route by walking distance with a single traversal.
+    # method is "dijkstra" or "astar"; A* needs shop coordinates (x, y) and edge
+    # weights that are never shorter than the straight-line distance.
+    # method="bidirectional" ignores walking distances and returns a fewest-hops
+    # path in the same format as bfs, meeting in the middle.
+    def shortest_path(self, start, end, method="dijkstra"):
+        if start not in self.adj_list:
+            raise ValueError(f"Shop {start} doesn't exist!")
+        if end not in self.adj_list:
+            raise ValueError(f"Shop {end} doesn't exist!")
+
+        if method not in ("dijkstra", "astar", "bidirectional"):
+            raise ValueError(f"Unknown routing method: {method}")
+        if not self.components.connected(start, end):
+            return []
+
+        if self.route_cache is not None:
+            path = self.route_cache.get(start, end, method)
+            if path is not None:
+                return path
+
+        recorder = metrics.recorder
+        if recorder is not None:
+            started = time.perf_counter()
+        if method == "bidirectional":
+            path = self._bidirectional_bfs(start, end)
+            visited = None
         else:
-            return path_dfs if len(path_dfs) < len(path_bfs) else path_bfs
-        
-    # Compare the paths found by DFS and BFS
-    def compare_paths(self, start, end):
+            heuristic = self._distance_heuristic(end) if method == "astar" else None
+            prev_nodes, _ = self._dijkstra(start, end, heuristic)
+            path = self._build_path(prev_nodes, end)
+            visited = len(prev_nodes)
+        if recorder is not None:
+            recorder.record_search(f"graph.shortest_path.{method}", started, visited, path)
+        if self.route_cache is not None:
+            self.route_cache.put(start, end, method, path)
+        return path
+
+    def shortest_path_at(self, start, end, when):
+        # Cheapest route by walking time at a given moment (datetime, time or POSIX
+        # timestamp): each corridor costs its walking distance times the multiplier
+        # of its congestion profile for that hour. With the route cache enabled,
+        # routes are cached per hour, so repeated queries within an hour are hits.
+        if start not in self.adj_list:
+            raise ValueError(f"Shop {start} doesn't exist!")
+        if end not in self.adj_list:
+            raise ValueError(f"Shop {end} doesn't exist!")
+        hour = hour_of(when)
+        if not self.components.connected(start, end):
+            return []
+
+        method = ("dijkstra", hour)
+        if self.route_cache is not None:
+            path = self.route_cache.get(start, end, method)
+            if path is not None:
+                return path
+
+        recorder = metrics.recorder
+        if recorder is not None:
+            started = time.perf_counter()
+        prev_nodes = self._timed_dijkstra(start, end, hour)
+        path = self._build_path(prev_nodes, end)
+        if recorder is not None:
+            recorder.record_search("graph.shortest_path_at", started, len(prev_nodes), path)
+        if self.route_cache is not None:
+            self.route_cache.put(start, end, method, path)
+        return path
+
+    def _timed_dijkstra(self, start, end, hour):
+        # _dijkstra with every edge weight scaled by its multiplier for the hour
+        slots, values = self.congestion.slots, self.congestion.values
+        dist = {start: 0}
+        prev_nodes = {start: None}
+        settled = set()
+        heap = [(0, start)]
+
+        while heap:
+            _, vertex = heapq.heappop(heap)
+            if vertex in settled:
+                continue
+            if vertex == end:
+                break
+            settled.add(vertex)
+            for neighbour, weight in self.adj_list[vertex].items():
+                slot = slots.get((vertex, neighbour) if vertex <= neighbour else (neighbour, vertex))
+                if slot is not None:
+                    weight *= values[slot * HOURS + hour]
+                cost = dist[vertex] + weight
+                if cost < dist.get(neighbour, math.inf):
+                    dist[neighbour] = cost
+                    prev_nodes[neighbour] = vertex
+                    heapq.heappush(heap, (cost, neighbour))
+
+        return prev_nodes
+
+    def path_cost_at(self, path, when):
+        # Walking time along a path at a given moment, see shortest_path_at
+        hour = hour_of(when)
+        return sum(self.adj_list[a][b] * self.congestion.multiplier(a, b, hour) for a, b in zip(path, path[1:]))
+
+    def k_shortest_paths(self, start, end, k=3, method="dijkstra"):
+        # Up to k loopless routes from start to end, cheapest first (Yen's algorithm).
+        # method is "dijkstra" (walking distance) or "bfs" (hop count).
+        # One search from end gives the exact remaining distance of every shop. It
+        # serves as the A* heuristic of every spur search, and whenever the best
+        # route onward from a spur shop avoids the blocked shops and corridors it
+        # is taken as is, with no search at all. Spurs before the point where a
+        # route left its parent route were already tried for the parent (Lawler's
+        # refinement), so they are skipped.
         if start not in self.adj_list:
             raise ValueError(f"Shop {start} doesn't exist!")
         if end not in self.adj_list:
             raise ValueError(f"Shop {end} doesn't exist!")
+        if method not in ("dijkstra", "bfs"):
+            raise ValueError(f"Unknown routing method: {method}")
+        if k < 1:
+            raise ValueError("k must be positive.")
+        if not self.components.connected(start, end):
+            return []
+
+        recorder = metrics.recorder
+        if recorder is not None:
+            started = time.perf_counter()
+        weighted = method == "dijkstra"
+        if weighted:
+            next_nodes, remaining = self._dijkstra(end, None)
+        else:
+            next_nodes, remaining = self._bfs_tree(end, None)
+
+        def cost(path):
+            return self.path_cost(path) if weighted else len(path) - 1
+
+        routes = [self._build_path(next_nodes, start)[::-1]]
+        deviation = 0
+        candidates = []
+        seen = {tuple(routes[0])}
+        searches = 0
+        while len(routes) < k:
+            previous = routes[-1]
+            for i in range(deviation, len(previous) - 1):
+                spur, root = previous[i], previous[:i + 1]
+                # Corridors already taken from this spur by routes sharing the root
+                blocked_edges = {route[i + 1] for route in routes if route[:i + 1] == root}
+                blocked = set(root[:-1])
+                spur_path = self._build_path(next_nodes, spur)[::-1]
+                if spur_path[1] in blocked_edges or not blocked.isdisjoint(spur_path):
+                    spur_path = self._spur_search(spur, end, remaining, blocked, blocked_edges, weighted)
+                    searches += 1
+                if not spur_path:
+                    continue
+                route = root[:-1] + spur_path
+                if tuple(route) not in seen:
+                    seen.add(tuple(route))
+                    heapq.heappush(candidates, (cost(route), len(route), route, i))
+            if not candidates:
+                break
+            _, _, route, deviation = heapq.heappop(candidates)
+            routes.append(route)
+
+        if recorder is not None:
+            recorder.observe("graph.k_shortest_paths.spur_searches", searches)
+            recorder.record_search(f"graph.k_shortest_paths.{method}", started, None, routes[-1])
+        return routes
+
+    def _spur_search(self, start, end, remaining, blocked, blocked_edges, weighted):
+        # A* from start to end avoiding the blocked shops and the corridors from start
+        # to blocked_edges. remaining holds exact distances to end in the full graph,
+        # which can only grow when shops and corridors are blocked, so it never
+        # overestimates. Returns the path or [].
+        dist = {start: 0}
+        prev_nodes = {start: None}
+        settled = set()
+        # Ties go to the entry with the larger distance so far, which with an exact
+        # heuristic walks straight to end instead of fanning out over equal routes
+        heap = [(remaining[start], 0, start)]
+
+        while heap:
+            _, _, vertex = heapq.heappop(heap)
+            if vertex in settled:
+                continue
+            if vertex == end:
+                return self._build_path(prev_nodes, end)
+            settled.add(vertex)
+            for neighbour, weight in self.adj_list[vertex].items():
+                if neighbour in blocked or (vertex == start and neighbour in blocked_edges):
+                    continue
+                cost = dist[vertex] + (weight if weighted else 1)
+                if cost < dist.get(neighbour, math.inf):
+                    dist[neighbour] = cost
+                    prev_nodes[neighbour] = vertex
+                    heapq.heappush(heap, (cost + remaining[neighbour], -cost, neighbour))
+        return []
+
+    def routes_from(self, start, targets=None, method="dijkstra"):
+        # Routes from one shop to many with a single search. Returns a RouteTree
+        # holding the predecessor map; the search stops once every target is reached
+        # (targets=None covers the whole component). method is "dijkstra" (walking
+        # distance) or "bfs" (hop count).
+        if start not in self.adj_list:
+            raise ValueError(f"Shop {start} doesn't exist!")
+        if targets is not None:
+            targets = set(targets)
+            for target in targets:
+                if target not in self.adj_list:
+                    raise ValueError(f"Shop {target} doesn't exist!")
+            # Targets in other components would keep the search going to the end
+            reachable = {target for target in targets if self.components.connected(start, target)}
+        else:
+            reachable = None
+
+        if method == "dijkstra":
+            prev_nodes, dist = self._dijkstra(start, None, targets=reachable)
+        elif method == "bfs":
+            prev_nodes, dist = self._bfs_tree(start, None, reachable)
+        else:
+            raise ValueError(f"Unknown routing method: {method}")
+        return RouteTree(start, prev_nodes, dist, targets)
+
+    def nearest(self, start, category, k=1, method="dijkstra", candidates=None):
+        # The k closest shops of a category, found with one search that stops as soon
+        # as k of them are reached. candidates is an optional collection of the shop
+        # numbers in the category (such as ShopHashTable.table[category]); it is only
+        # used for membership tests and lets the search stop once every candidate is
+        # found. The search also stops once the whole component of start is settled.
+        # Returns [(shop number, distance, path), ...], closest first; start counts
+        # when it matches. method is "dijkstra" (walking distance) or "bfs" (hop count).
+        if start not in self.adj_list:
+            raise ValueError(f"Shop {start} doesn't exist!")
+        if method not in ("dijkstra", "bfs"):
+            raise ValueError(f"Unknown routing method: {method}")
+        if k < 1:
+            raise ValueError("k must be positive.")
+
+        recorder = metrics.recorder
+        if recorder is not None:
+            started = time.perf_counter()
+        if isinstance(candidates, (list, tuple)):
+            candidates = set(candidates)
+        wanted = min(k, len(candidates)) if candidates is not None else k
+        reachable = self.components.component_size(start)
+        dist = {start: 0}
+        prev_nodes = {start: None}
+        settled = set()
+        heap = [(0, start)]
+        found = []
+
+        while heap and len(found) < wanted and len(settled) < reachable:
+            _, vertex = heapq.heappop(heap)
+            if vertex in settled:
+                continue
+            settled.add(vertex)
+            if candidates is not None:
+                matches = vertex in candidates
+            else:
+                matches = self.shops[vertex].category == category
+            if matches:
+                found.append(vertex)
+            for neighbour, weight in self.adj_list[vertex].items():
+                cost = dist[vertex] + (weight if method == "dijkstra" else 1)
+                if cost < dist.get(neighbour, math.inf):
+                    dist[neighbour] = cost
+                    prev_nodes[neighbour] = vertex
+                    heapq.heappush(heap, (cost, neighbour))
+
+        results = [(number, dist[number], self._build_path(prev_nodes, number)) for number in found]
+        if recorder is not None:
+            recorder.record_search(f"graph.nearest.{method}", started, len(settled), results[-1][2] if results else [])
+        return results
+
+    def distance_matrix(self, sources, targets, method="dijkstra"):
+        # One search per source; returns a row of distances per source in the
+        # order of targets, with None for unreachable pairs.
+        targets = list(targets)
+        matrix = []
+        for source in sources:
+            tree = self.routes_from(source, targets, method)
+            matrix.append([tree.distance(target) for target in targets])
+        return matrix
+
+    # Compare the paths found by DFS and BFS
+    def compare_paths(self, start, end):
+        if not self.has_vertex(start):
+            raise ValueError(f"Shop {start} doesn't exist!")
+        if not self.has_vertex(end):
+            raise ValueError(f"Shop {end} doesn't exist!")
 
         path_dfs = self.dfs(start, end)
         path_bfs = self.bfs(start, end)
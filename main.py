@@ -1,17 +1,68 @@
-from graph import Graph
+from commands import execute
 from shop import Shop
-from shophashtable import ShopHashTable
-from shopheap import ShopHeap
-import copy
+from shopstore import ShopStore
+from snapshot import save_snapshot, load_snapshot
+import argparse
+import contextlib
+import json
+import sys
 
 
 class MainApp:
         def __init__(self):
-            #Initialize the main application with a graph, hash table, and heap.
-            self.graph = Graph()
-            self.shop_table = ShopHashTable()
-            self.shop_heap = ShopHeap()
+            #Initialize the main application with a store that keeps the graph, hash table, and heap in sync.
+            self.store = ShopStore(cache_routes=True)
+
+        @property
+        def graph(self):
+            return self.store.graph
+
+        @property
+        def shop_table(self):
+            return self.store.shop_table
+
+        @property
+        def shop_heap(self):
+            return self.store.shop_heap
             
+        #Bulk-load shops and connections from CSV files into the graph, hash table, and heap.
+        def load_data(self, shops_path, edges_path):
+            errors = self.store.load_csv(shops_path, edges_path)
+            edge_count = sum(len(neighbours) for neighbours in self.graph.adj_list.values()) // 2
+            print(f"Loaded {len(self.graph.shops)} shops and {edge_count} connections.")
+            if errors:
+                print(f"Skipped {len(errors)} malformed rows:")
+                for error in errors:
+                    print(f"  {error}")
+            return errors
+
+        #Save the graph, hash table, and heap to a binary snapshot file.
+        def save_snapshot(self, path):
+            save_snapshot(path, self.graph, self.shop_table, self.shop_heap)
+            print(f"Snapshot saved to {path}.")
+
+        #Restore from a binary snapshot. The graph stays memory-mapped and read-only until the first edit.
+        def load_snapshot(self, path):
+            self.store = ShopStore(*load_snapshot(path), cache_routes=True)
+            print(f"Loaded {len(self.graph)} shops from snapshot {path}.")
+
+        #Run JSON-lines commands (see commands.py) without prompts, writing one JSON result per line.
+        def run_batch(self, commands, results):
+            failed = 0
+            for line_number, line in enumerate(commands, 1):
+                if not line.strip():
+                    continue
+                try:
+                    command = json.loads(line)
+                except json.JSONDecodeError as e:
+                    response = {"ok": False, "error": f"Invalid JSON: {e}"}
+                else:
+                    response = execute(self.store, command)
+                response.setdefault("line", line_number)
+                failed += not response["ok"]
+                results.write(json.dumps(response) + "\n")
+            return failed
+
         #Display the main menu and handle user choices.
         def menu(self):
             while True:
@@ -23,8 +74,8 @@ class MainApp:
                     print("3.  Update Shop Details")
                     print("4.  Add Connection Between Shops")
                     print("5.  Delete Connection")
-                    print("6.  Find Path Between Shops (DFS/BFS)")
-                    print("7.  Display Shortest Path (DFS/BFS)")
+                    print("6.  Find Path Between Shops (DFS/BFS/Bidirectional)")
+                    print("7.  Display Shortest Path (Dijkstra/A*)")
                     print("8.  Compare Paths (DFS vs BFS)")
                     print("9. Display All Shops")
                     
@@ -109,13 +160,11 @@ class MainApp:
                 
             shop = Shop(number, name, category, location, rating)
 
-            self.graph.add_vertex(shop)
-            self.shop_table.insert(shop)
-            self.shop_heap.insert(shop)
+            self.store.add(shop)
 
             print(f"Shop {name} added successfully!")
 
-        #Remove a shop from the graph and hash table.
+        #Remove a shop from the graph, hash table, and heap.
         def delete_shop(self):
             number = int(input("Enter Shop Number to Delete: "))
             shop = self.graph.shops.get(number)
@@ -123,8 +172,7 @@ class MainApp:
                 print("Shop not found!")
                 return
 
-            self.graph.remove_vertex(number)
-            self.shop_table.delete(shop)
+            self.store.remove(number)
 
             print(f"Shop {shop.name} deleted successfully!")
             
@@ -135,8 +183,6 @@ class MainApp:
             if not shop:
                 print("Shop not found!")
                 return
-        
-            old_shop_copy = copy.deepcopy(shop)
 
             print("Enter new details (leave blank to keep current value):")
             name = input(f"Current Name ({shop.name}): ") or shop.name
@@ -154,24 +200,8 @@ class MainApp:
                 except ValueError:
                     print("Please enter a valid rating between 1 and 5.")
 
-            self.graph.update_shop(number, "name", name)
-            self.graph.update_shop(number, "category", category)
-            self.graph.update_shop(number, "location", location)
-            self.graph.update_shop(number, "rating", rating)
-
-        # If the shop's category has changed, update it in the hashtable
-            if old_shop_copy.category != category:
-                try:
-                    self.shop_table.delete(old_shop_copy)
-                except ValueError as e:
-                    print(f"An error occurred: {e}")
-                self.shop_table.insert(self.graph.shops.get(number))  # get the updated shop from the graph
-
-        # If the shop's rating has changed, clear the heap and reinsert all shops
-            if old_shop_copy.rating != rating:
-                self.shop_heap.clear()
-                for shop in self.graph.shops.values():
-                    self.shop_heap.insert(shop)
+            # The store updates the graph, hash table, and heap in one pass
+            self.store.update(number, name=name, category=category, location=location, rating=rating)
 
             print(f"Shop {number} updated successfully!")
 
@@ -181,7 +211,9 @@ class MainApp:
             try:
                 source = int(input("Enter Source Shop Number: "))
                 dest = int(input("Enter Destination Shop Number: "))
-                self.graph.add_edge(source, dest)
+                weight_input = input("Enter Walking Distance (leave blank for 1): ")
+                weight = float(weight_input) if weight_input else 1
+                self.store.connect(source, dest, weight)
                 print(f"Connection between Shop {source} and Shop {dest} has been added!")
             except ValueError as e:
                 print(e)
@@ -194,7 +226,7 @@ class MainApp:
                 source = int(input("Enter Source Shop Number: "))
                 dest = int(input("Enter Destination Shop Number: "))
 
-                self.graph.remove_edge(source, dest)
+                self.store.disconnect(source, dest)
                 print(f"Connection between Shop {source} and Shop {dest} removed!")
             except ValueError as e:
                 print(f"Error: {e}")  # Display the error message from the raised exception.
@@ -202,32 +234,40 @@ class MainApp:
                 print(f"An unexpected error occurred: {e}")  # For other unexpected errors.
 
         #Search for shops by their category in the hash table.
-        def search_shop(self):
+        def search_shop(self, page_size=20):
             category = input("Enter category to search: ")
-            shops = self.shop_table.search(category)
-            if not shops:
-                print(f"No shops found in the category '{category}'.")
-                return
-
-            print(f"\nShops in the category '{category}':")
-            print("-" * 40)
-            for shop in shops:
-                print(f"Shop Number: {shop.number}")
-                print(f"Shop Name: {shop.name}")
-                print(f"Location: {shop.location}")
-                print(f"Rating: {shop.rating}")
-                print("-" * 40)
-
-        #Display shops in a specific category, sorted by their ratings, using the heap.
+            offset = 0
+            while True:
+                shops = list(self.shop_table.iter_search(category, offset, page_size))
+                if not shops:
+                    if offset == 0:
+                        print(f"No shops found in the category '{category}'.")
+                    return
+
+                if offset == 0:
+                    print(f"\nShops in the category '{category}':")
+                    print("-" * 40)
+                for shop in shops:
+                    print(f"Shop Number: {shop.number}")
+                    print(f"Shop Name: {shop.name}")
+                    print(f"Location: {shop.location}")
+                    print(f"Rating: {shop.rating}")
+                    print("-" * 40)
+
+                offset += page_size
+                if len(shops) < page_size or input("Show more? (y/n): ").lower() != "y":
+                    return
+
+        #Display the top rated shops in a specific category, using the heap.
         def display_shops_by_rating(self):
             category = input("Enter category to display shops by rating: ")
-            shops = self.shop_table.search(category)
-            if not shops:
+            count_input = input("How many shops to show (leave blank for 10): ")
+            count = int(count_input) if count_input else 10
+            sorted_shops = self.shop_heap.top_k(count, category)
+            if not sorted_shops:
                 print(f"No shops found in the category '{category}'.")
                 return
 
-            sorted_shops = self.shop_heap.sort_shops(shops)
-
             print(f"\nShops in the category '{category}' sorted by rating:")
             print("-" * 50)
             for shop in sorted_shops:
@@ -258,9 +298,11 @@ class MainApp:
             source = int(input("Enter Source Shop Number: "))
             dest = int(input("Enter Destination Shop Number: "))
             
-            method = input("Choose a method (dfs/bfs): ")
+            method = input("Choose a method (dfs/bfs/bidirectional): ")
             if method == "dfs":
                 path = self.graph.dfs(source, dest)
+            elif method == "bidirectional":
+                path = self.graph.shortest_path(source, dest, method="bidirectional")
             else:
                 path = self.graph.bfs(source, dest)
 
@@ -274,7 +316,8 @@ class MainApp:
             source = int(input("Enter Source Shop Number: "))
             dest = int(input("Enter Destination Shop Number: "))
 
-            path = self.graph.shortest_path(source, dest)
+            method = input("Choose a method (dijkstra/astar): ") or "dijkstra"
+            path = self.graph.shortest_path(source, dest, method)
             
             if not path:
                 print("No path found between the two shops!")
@@ -284,6 +327,7 @@ class MainApp:
             for p in path:
                 print(p, end=" -> ")
             print("End")
+            print(f"Walking Distance: {self.graph.path_cost(path)}")
          
         #Compare the lengths of paths obtained using DFS and BFS in the graph.
         def compare_path_lengths(self):
@@ -298,10 +342,37 @@ class MainApp:
             except Exception as e:
                 print(f"An error occurred: {e}")
 
-if __name__ == "__main__":
-    app = MainApp()
-    app.menu()
-
-
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Shop Finding & Navigation System")
+    parser.add_argument("data", nargs="*", help="shops.csv and edges.csv, or a snapshot file")
+    parser.add_argument("--batch", metavar="COMMANDS",
+                        help="run JSON-lines commands from this file ('-' for stdin) instead of the menu")
+    parser.add_argument("--output", default="-", help="where batch results are written (default: stdout)")
+    parser.add_argument("--save-snapshot", metavar="PATH", help="save a snapshot after the batch has run")
+    args = parser.parse_args(argv)
+    if len(args.data) > 2:
+        parser.error("expected shops.csv edges.csv, or a single snapshot file")
+    return args
 
 
+if __name__ == "__main__":
+    args = parse_args()
+    app = MainApp()
+    # Optional startup data: python main.py shops.csv edges.csv, or python main.py mall.snapshot.
+    # In batch mode the load report goes to stderr so stdout only carries results.
+    with contextlib.redirect_stdout(sys.stderr if args.batch else sys.stdout):
+        if len(args.data) == 2:
+            app.load_data(args.data[0], args.data[1])
+        elif len(args.data) == 1:
+            app.load_snapshot(args.data[0])
+
+    if args.batch:
+        # e.g. python main.py shops.csv edges.csv --batch commands.jsonl --output results.jsonl
+        with contextlib.ExitStack() as stack:
+            commands = sys.stdin if args.batch == "-" else stack.enter_context(open(args.batch))
+            results = sys.stdout if args.output == "-" else stack.enter_context(open(args.output, "w"))
+            app.run_batch(commands, results)
+        if args.save_snapshot:
+            save_snapshot(args.save_snapshot, app.graph, app.shop_table, app.shop_heap)
+    else:
+        app.menu()
@@ -0,0 +1,98 @@
+import json
+import math
+import threading
+import time
+
+# Opt-in instrumentation for the graph, hash table and heap hot paths.
+# Instrumented code reads `metrics.recorder` once per call and does nothing more
+# while it is None, so leaving instrumentation off costs a single attribute lookup.
+recorder = None
+
+
+class Histogram:
+    def __init__(self):
+        # Power-of-two buckets: bucket e counts values in [2**(e-1), 2**e)
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.buckets = {}
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        bucket = math.frexp(value)[1] if value > 0 else None
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+            # Upper bound of each bucket -> number of values; "0" holds zero values
+            "buckets": {("0" if bucket is None else repr(math.ldexp(1, bucket))): n
+                        for bucket, n in sorted(self.buckets.items(), key=lambda item: (item[0] is not None, item[0] or 0))},
+        }
+
+
+class Recorder:
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, value):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.add(value)
+
+    def record_search(self, name, started, visited, path):
+        # Shared by the graph searches: timing, vertices reached and path length
+        with self.lock:
+            for suffix, value in (("seconds", time.perf_counter() - started),
+                                  ("nodes_visited", visited), ("path_length", len(path))):
+                if value is None:
+                    continue
+                key = f"{name}.{suffix}"
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    histogram = self.histograms[key] = Histogram()
+                histogram.add(value)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "counters": dict(self.counters),
+                "histograms": {name: histogram.summary() for name, histogram in sorted(self.histograms.items())},
+            }
+
+
+def enable():
+    # Start recording into a fresh Recorder and return it
+    global recorder
+    recorder = Recorder()
+    return recorder
+
+
+def disable():
+    global recorder
+    recorder = None
+
+
+def snapshot():
+    # Current counters and histogram summaries ({} while disabled)
+    return recorder.snapshot() if recorder is not None else {}
+
+
+def dump(path):
+    with open(path, "w") as f:
+        json.dump(snapshot(), f, indent=2)
@@ -0,0 +1,182 @@
+from bisect import bisect_left, insort
+from collections import Counter
+import heapq
+from itertools import chain
+import math
+import metrics
+
+
+def normalize(name):
+    # Names are matched case-insensitively and ignoring surrounding/repeated spaces
+    return " ".join(name.casefold().split())
+
+
+def trigrams(text):
+    # Overlapping three-letter pieces of the padded text: "cafe" -> "  c", " ca", "caf", "afe", "fe "
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class ShopNameIndex:
+    # Most posting-list entries fuzzy() reads to collect candidates (the rarest list
+    # is always read). Queries made only of common trigrams then cost the same at
+    # any mall size, and their matches are the best among the shops that contain
+    # the rarest of those trigrams.
+    MAX_CANDIDATES = 20000
+
+    def __init__(self):
+        # Index over Shop.name for autocomplete and typo-tolerant lookup.
+        # names is a sorted list of (normalised name, shop number), so all names with
+        # a given prefix form one contiguous run found by binary search; grams maps
+        # each trigram to the shops whose name contains it.
+        self.names = []
+        self.grams = {}
+        self.entries = {}  # shop number -> normalised name
+        self.gram_counts = {}  # shop number -> number of distinct trigrams in its name
+        self.lengths = {}  # number of distinct trigrams -> shops whose name has that many
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, shop_number):
+        return shop_number in self.entries
+
+    def _file_grams(self, number, name):
+        grams = trigrams(name)
+        for gram in grams:
+            self.grams.setdefault(gram, set()).add(number)
+        self.gram_counts[number] = len(grams)
+        self.lengths.setdefault(len(grams), set()).add(number)
+
+    def insert(self, shop):
+        # Add a shop, or re-file it if its name changed
+        name = normalize(shop.name)
+        if self.entries.get(shop.number) == name:
+            return
+        if shop.number in self.entries:
+            self.delete(shop.number)
+        self.entries[shop.number] = name
+        insort(self.names, (name, shop.number))
+        self._file_grams(shop.number, name)
+
+    def insert_many(self, shops):
+        # Batch insert: append everything and sort once
+        added = False
+        for shop in shops:
+            if shop.number in self.entries:
+                self.insert(shop)
+                continue
+            name = normalize(shop.name)
+            self.entries[shop.number] = name
+            self.names.append((name, shop.number))
+            self._file_grams(shop.number, name)
+            added = True
+        if added:
+            self.names.sort()
+
+    def delete(self, shop_number):
+        name = self.entries.pop(shop_number, None)
+        if name is None:
+            raise ValueError(f"Shop {shop_number} is not in the name index!")
+        del self.names[bisect_left(self.names, (name, shop_number))]
+        length = self.gram_counts.pop(shop_number)
+        self.lengths[length].discard(shop_number)
+        if not self.lengths[length]:
+            del self.lengths[length]
+        for gram in trigrams(name):
+            members = self.grams[gram]
+            members.discard(shop_number)
+            if not members:
+                del self.grams[gram]
+
+    def prefix_range(self, text):
+        # (lo, hi) such that names[lo:hi] are exactly the names starting with text
+        text = normalize(text)
+        names = self.names
+        lo = bisect_left(names, (text,))
+        # Every name with the prefix sorts before text followed by the largest character
+        hi = bisect_left(names, (text + "\U0010ffff",), lo)
+        return lo, hi
+
+    def prefix(self, text):
+        # Numbers of the shops whose name starts with text, in name order
+        lo, hi = self.prefix_range(text)
+        return [number for _, number in self.names[lo:hi]]
+
+    def fuzzy(self, text, min_similarity=0.5, limit=None):
+        # Numbers of the shops whose name shares enough trigrams with text to be a
+        # likely misspelling, as {number: similarity}. Similarity is the Dice
+        # coefficient of the two trigram sets (1.0 for an exact match). With a limit,
+        # only the limit most similar names are returned, plus any tied with the last.
+        query = trigrams(normalize(text))
+        q = len(query)
+        postings = sorted((self.grams.get(gram, set()) for gram in query), key=len)
+        # A name sharing c of the query's q trigrams scores at most 2c / (q + c), so a
+        # match shares at least `required` of them and must therefore appear in one of
+        # the q - required + 1 rarest posting lists. Common trigrams such as "sho" are
+        # then only used to count, never to collect candidates.
+        required = max(1, math.ceil(min_similarity * len(query) / (2 - min_similarity)))
+        rare = []
+        read = 0
+        for members in postings[:q - required + 1]:
+            if rare and read + len(members) > self.MAX_CANDIDATES:
+                break
+            rare.append(members)
+            read += len(members)
+        # Trigrams whose lists were not read: a candidate may contain all of them
+        others = q - len(rare)
+
+        # Shops in two or more rare lists are the likeliest matches, and set
+        # intersections find them without walking the rest of each list. A shop in h
+        # rare lists turns up in h(h - 1) / 2 of the intersections, so counting those
+        # ranks the shops by h and the best candidates are scored first.
+        pairs = Counter()
+        for i, first in enumerate(rare):
+            for second in rare[i + 1:]:
+                pairs.update(first & second)
+
+        def singles():
+            # Then the shops in just one rare list, which share at most 1 + others
+            # trigrams. How close such a name can get depends only on its own trigram
+            # count, so the lists are intersected with one name length at a time, most
+            # promising first, until no length can reach the threshold.
+            most = 1 + others
+            for length in sorted(self.lengths, key=lambda length: -min(length, most) / (q + length)):
+                if 2 * min(length, most) < threshold * (q + length):
+                    break
+                shops = self.lengths[length]
+                for members in rare:
+                    for number in members & shops:
+                        if number not in pairs:
+                            yield number, 1
+
+        ranked = chain(((number, (1 + math.isqrt(1 + 8 * count)) // 2) for number, count in pairs.most_common()),
+                       singles())
+        matches = {}
+        best = []  # the limit highest similarities so far (a min-heap)
+        threshold = min_similarity
+        gram_counts = self.gram_counts
+        scored = 0
+        for number, hits in ranked:
+            # The name shares at most hits + others trigrams with the query
+            most = hits + others
+            if 2 * most < threshold * (q + most):
+                break
+            grams = gram_counts[number]
+            if 2 * min(grams, most) < threshold * (q + grams):
+                continue
+            scored += 1
+            similarity = 2 * sum([number in members for members in postings]) / (q + grams)
+            if similarity < threshold:
+                continue
+            matches[number] = similarity
+            if limit is not None:
+                heapq.heappush(best, similarity)
+                if len(best) > limit:
+                    heapq.heappop(best)
+                if len(best) == limit:
+                    threshold = best[0]
+        recorder = metrics.recorder
+        if recorder is not None:
+            recorder.observe("nameindex.fuzzy.scored", scored)
+        return {number: similarity for number, similarity in matches.items() if similarity >= threshold}
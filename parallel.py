@@ -0,0 +1,91 @@
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from csrgraph import CSRGraph
+from multiprocessing import shared_memory
+import csv
+
+# Adjacency arrays attached in each worker process by _attach
+_offsets = None
+_neighbours = None
+_targets = None
+_blocks = []
+
+
+def _share(values):
+    # Copy an int64 array into a new shared memory block
+    data = array("q", values)
+    block = shared_memory.SharedMemory(create=True, size=max(len(data) * data.itemsize, 1))
+    block.buf[:len(data) * data.itemsize] = data.tobytes()
+    return block
+
+
+def _attach(offsets_name, neighbours_name, targets_name, n, m, t):
+    # Worker initializer: map the shared arrays instead of receiving a pickled graph
+    global _offsets, _neighbours, _targets
+    views = []
+    for name, length in ((offsets_name, n + 1), (neighbours_name, m), (targets_name, t)):
+        block = shared_memory.SharedMemory(name=name)
+        _blocks.append(block)
+        views.append(block.buf[:length * 8].cast("q"))
+    _offsets, _neighbours, _targets = views
+
+
+def _hop_rows(sources):
+    # BFS hop counts from each source (vertex index) to every target; -1 when unreachable
+    offsets, neighbours, targets = _offsets, _neighbours, _targets
+    remaining_targets = set(targets)
+    rows = []
+    for source in sources:
+        dist = {source: 0}
+        frontier = [source]
+        remaining = len(remaining_targets) - (source in remaining_targets)
+        depth = 0
+        while frontier and remaining:
+            depth += 1
+            next_frontier = []
+            for vertex in frontier:
+                for neighbour in neighbours[offsets[vertex]:offsets[vertex + 1]]:
+                    if neighbour not in dist:
+                        dist[neighbour] = depth
+                        next_frontier.append(neighbour)
+                        if neighbour in remaining_targets:
+                            remaining -= 1
+            frontier = next_frontier
+        rows.append([dist.get(target, -1) for target in targets])
+    return rows
+
+
+def parallel_distance_matrix(graph, path, sources=None, targets=None, workers=None, chunk_size=64):
+    # Write the hop-count matrix between sources and targets (all shops by default)
+    # to a CSV file, one row per source. Sources are sharded across a process pool;
+    # the adjacency arrays are placed in shared memory once instead of pickling the
+    # graph for every task, and rows are written as soon as their chunk is done.
+    # Unreachable pairs are left empty. Returns the number of rows written.
+    frozen = graph if isinstance(graph, CSRGraph) else graph.freeze()
+    sources = list(frozen.numbers) if sources is None else list(sources)
+    targets = list(frozen.numbers) if targets is None else list(targets)
+    source_indexes = [frozen._vertex(source) for source in sources]
+    target_indexes = [frozen._vertex(target) for target in targets]
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be positive.")
+
+    blocks = [_share(frozen.offsets), _share(frozen.neighbours), _share(target_indexes)]
+    try:
+        chunks = [source_indexes[i:i + chunk_size] for i in range(0, len(source_indexes), chunk_size)]
+        initargs = (blocks[0].name, blocks[1].name, blocks[2].name,
+                    len(frozen.numbers), len(frozen.neighbours), len(target_indexes))
+        written = 0
+        with open(path, "w", newline="") as f, \
+                ProcessPoolExecutor(workers, initializer=_attach, initargs=initargs) as executor:
+            writer = csv.writer(f)
+            writer.writerow(["source"] + targets)
+            # map yields chunks in order, so rows stream out while later chunks run
+            for chunk, rows in zip(chunks, executor.map(_hop_rows, chunks)):
+                for index, row in zip(chunk, rows):
+                    writer.writerow([frozen.numbers[index]] + ["" if d < 0 else d for d in row])
+                written += len(rows)
+        return written
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
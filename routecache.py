@@ -0,0 +1,191 @@
+from collections import OrderedDict
+import threading
+
+
+class RouteCache:
+    def __init__(self, max_entries=4096, max_nodes=1_000_000):
+        # Bounded LRU cache of routes keyed on (start, end, method).
+        # max_entries limits the number of cached routes and max_nodes the total
+        # number of vertices stored across all cached paths.
+        if max_entries < 1 or max_nodes < 1:
+            raise ValueError("Cache limits must be positive.")
+        self.max_entries = max_entries
+        self.max_nodes = max_nodes
+        self.entries = OrderedDict()
+        self.stored_nodes = 0
+        # Reverse indexes used for precise invalidation
+        self.edge_index = {}
+        self.vertex_index = {}
+        # Precomputed shortest-path trees keyed on (method, source): (prev_nodes, dist)
+        self.trees = {}
+        self.hits = 0
+        self.misses = 0
+        # Lookups may come from several reader threads (see server.py); graph
+        # mutations, and so the invalidation hooks, never run alongside them
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def _edge_key(a, b):
+        return (a, b) if a <= b else (b, a)
+
+    @staticmethod
+    def _tree_method(method):
+        # A* returns routes of the same cost as Dijkstra and bidirectional BFS
+        # the same hop count as BFS, so they can share those trees
+        if method == "astar":
+            return "dijkstra"
+        if method == "bidirectional":
+            return "bfs"
+        return method
+
+    def get(self, start, end, method):
+        # Return the cached path as a new list, or None on a miss
+        with self.lock:
+            return self._get(start, end, method)
+
+    def _get(self, start, end, method):
+        key = (start, end, method)
+        path = self.entries.get(key)
+        if path is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return list(path)
+
+        tree = self.trees.get((self._tree_method(method), start))
+        if tree is not None:
+            prev_nodes = tree[0]
+            self.hits += 1
+            if end not in prev_nodes:
+                return []
+            path = []
+            while end is not None:
+                path.append(end)
+                end = prev_nodes[end]
+            path.reverse()
+            return path
+
+        self.misses += 1
+        return None
+
+    def put(self, start, end, method, path):
+        with self.lock:
+            self._put(start, end, method, path)
+
+    def _put(self, start, end, method, path):
+        key = (start, end, method)
+        if key in self.entries:
+            self._discard(key)
+        if len(path) > self.max_nodes:
+            return
+        path = tuple(path)
+        self.entries[key] = path
+        self.stored_nodes += len(path)
+        # Unreachable results are indexed by their endpoints so that removing
+        # either shop drops them; reachable ones by every vertex on the path.
+        for vertex in path or (start, end):
+            self.vertex_index.setdefault(vertex, set()).add(key)
+        for a, b in zip(path, path[1:]):
+            self.edge_index.setdefault(self._edge_key(a, b), set()).add(key)
+
+        while len(self.entries) > self.max_entries or self.stored_nodes > self.max_nodes:
+            self._discard(next(iter(self.entries)))
+
+    def _discard(self, key):
+        path = self.entries.pop(key)
+        self.stored_nodes -= len(path)
+        for vertex in path or key[:2]:
+            keys = self.vertex_index.get(vertex)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.vertex_index[vertex]
+        for a, b in zip(path, path[1:]):
+            edge = self._edge_key(a, b)
+            keys = self.edge_index.get(edge)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.edge_index[edge]
+
+    def clear(self):
+        # Drop every cached route and precomputed tree (counters are kept)
+        self.entries.clear()
+        self.edge_index.clear()
+        self.vertex_index.clear()
+        self.trees.clear()
+        self.stored_nodes = 0
+
+    def precompute(self, graph, method="bfs"):
+        # Fill a shortest-path tree for every source so lookups cost O(path length).
+        # method is "bfs" (hop counts) or "dijkstra" (walking distance).
+        if method == "bfs":
+            search = graph._bfs_tree
+        elif method == "dijkstra":
+            search = graph._dijkstra
+        else:
+            raise ValueError(f"Cannot precompute routes for method: {method}")
+        for source in graph.adj_list:
+            self.trees[(method, source)] = search(source, None)
+
+    def stats(self):
+        # Hit/miss counters and current occupancy
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self.entries),
+            "stored_nodes": self.stored_nodes,
+            "trees": len(self.trees),
+        }
+
+    # Invalidation hooks, called by Graph after every mutation
+
+    def on_add_vertex(self, shop_number):
+        # A new vertex has no edges yet, so no existing route changes
+        pass
+
+    def on_add_edge(self, source, destination, weight, components):
+        # Call before components merges the two endpoints. Only routes with an end in
+        # the component of source or of destination can gain a shorter alternative
+        # (or, between those two components, a route at all); the rest are kept.
+        # A tree stays valid when it reaches neither endpoint (another component)
+        # or when the new edge cannot shorten the distance to either endpoint.
+        find = components.find
+        joined = {find(source), find(destination)}
+        for key in [key for key in self.entries if find(key[0]) in joined or find(key[1]) in joined]:
+            self._discard(key)
+        for tree_key, (_, dist) in list(self.trees.items()):
+            method = tree_key[0]
+            step = 1 if method == "bfs" else weight
+            in_source, in_dest = source in dist, destination in dist
+            if not in_source and not in_dest:
+                continue
+            if in_source and in_dest and abs(dist[source] - dist[destination]) <= step:
+                continue
+            del self.trees[tree_key]
+
+    def on_remove_edge(self, source, destination):
+        # Only routes that walk along the removed edge are affected
+        for key in list(self.edge_index.get(self._edge_key(source, destination), ())):
+            self._discard(key)
+        for tree_key, (prev_nodes, _) in list(self.trees.items()):
+            if prev_nodes.get(destination) == source or prev_nodes.get(source) == destination:
+                del self.trees[tree_key]
+
+    def on_change_congestion(self, source, destination):
+        # A new congestion profile can make timed routes (method ("dijkstra", hour))
+        # dearer or open cheaper alternatives; routes by plain distance are unaffected
+        for key in [key for key in self.entries if isinstance(key[2], tuple)]:
+            self._discard(key)
+
+    def on_remove_vertex(self, shop_number):
+        # Routes through, from or to the removed shop are affected
+        for key in list(self.vertex_index.get(shop_number, ())):
+            self._discard(key)
+        for tree_key, (prev_nodes, _) in list(self.trees.items()):
+            if shop_number in prev_nodes:
+                del self.trees[tree_key]
@@ -0,0 +1,139 @@
+from commands import execute, is_write
+from shopstore import ShopStore
+from snapshot import load_snapshot
+import argparse
+import asyncio
+import contextlib
+import json
+import traceback
+
+
+class ReadWriteLock:
+    def __init__(self):
+        # Many readers or one writer at a time; waiting writers block new readers
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+        self._condition = asyncio.Condition()
+
+    @contextlib.asynccontextmanager
+    async def read(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: not self._writer and not self._waiting_writers)
+            self._readers += 1
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self._readers -= 1
+                self._condition.notify_all()
+
+    @contextlib.asynccontextmanager
+    async def write(self):
+        async with self._condition:
+            self._waiting_writers += 1
+            try:
+                await self._condition.wait_for(lambda: not self._writer and not self._readers)
+            finally:
+                self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self._writer = False
+                self._condition.notify_all()
+
+
+class ShopServer:
+    def __init__(self, store):
+        # Local JSON-lines server in front of a ShopStore: each request is one JSON
+        # command per line (see commands.py) and gets one JSON response line.
+        # Read commands run concurrently in worker threads; writes run one at a time.
+        self.store = store
+        self.lock = ReadWriteLock()
+        self.server = None
+
+    async def start(self, host="127.0.0.1", port=0, path=None):
+        # Listen on TCP (port 0 picks a free port) or, when path is given, a Unix socket
+        if path is not None:
+            self.server = await asyncio.start_unix_server(self._handle, path=path)
+        else:
+            self.server = await asyncio.start_server(self._handle, host, port)
+        return self.server
+
+    @property
+    def address(self):
+        return self.server.sockets[0].getsockname()
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def execute(self, command):
+        lock = self.lock.write() if isinstance(command, dict) and is_write(command) else self.lock.read()
+        async with lock:
+            return await asyncio.to_thread(execute, self.store, command)
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    command = json.loads(line)
+                except json.JSONDecodeError as e:
+                    response = {"ok": False, "error": f"Invalid JSON: {e}"}
+                else:
+                    try:
+                        response = await self.execute(command)
+                    except Exception as e:
+                        # A bug rather than a bad command: log it and keep serving
+                        traceback.print_exc()
+                        response = {"ok": False, "error": f"Internal error: {type(e).__name__}: {e}"}
+                        if isinstance(command, dict) and "id" in command:
+                            response["id"] = command["id"]
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+
+async def serve(store, host="127.0.0.1", port=8765, path=None):
+    server = ShopServer(store)
+    await server.start(host, port, path)
+    print(f"Serving on {path or server.address}")
+    async with server.server:
+        await server.server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve shop queries over a local socket.")
+    parser.add_argument("data", nargs="*", help="shops.csv and edges.csv, or a snapshot file")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", help="listen on this Unix socket path instead of TCP")
+    args = parser.parse_args()
+
+    store = ShopStore(cache_routes=True)
+    if len(args.data) == 2:
+        errors = store.load_csv(args.data[0], args.data[1])
+        for error in errors:
+            print(error)
+    elif len(args.data) == 1:
+        store = ShopStore(*load_snapshot(args.data[0]), cache_routes=True)
+    elif args.data:
+        parser.error("expected shops.csv edges.csv, or a single snapshot file")
+
+    asyncio.run(serve(store, args.host, args.port, args.unix))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,36 @@
 class Shop:
-    def __init__(self, number, name, category, location, rating):
+    # Fixed attribute slots instead of a per-instance __dict__ keep large catalogs compact
+    __slots__ = ("number", "name", "category", "location", "rating", "x", "y", "_hash")
+
+    def __init__(self, number, name, category, location, rating, x=None, y=None):
         if not 1 <= rating <= 5:
             raise ValueError("Rating should be between 1 and 5!")
-    
+
         self.number = number
         self.name = name
         self.category = category
         self.location = location
         self.rating = rating
+        # Optional floor-plan coordinates, used by A* routing
+        self.x = x
+        self.y = y
+        # The shop number never changes, so its hash is computed once
+        self._hash = hash(number)
 
     def __hash__(self):
-        #Returns a hash value for the Shop object.
-        return hash((self.number, self.name, self.category, self.location, self.rating))
+        #Returns a hash value for the Shop object, based on its stable shop number.
+        return self._hash
 
     def __eq__(self, other):
         #Checks if two Shop objects are equal based on their attributes.
+        if self is other:
+            return True
         if isinstance(other, Shop):
-            return (self.number, self.name, self.category, self.location, self.rating) == \
-                   (other.number, other.name, other.category, other.location, other.rating)
+            return (self.number == other.number and self.name == other.name
+                    and self.category == other.category and self.location == other.location
+                    and self.rating == other.rating)
         return False
 
     def __str__(self):
         #Returns a string representation of the Shop object.
         return f"Shop Number: {self.number}, Name: {self.name}, Category: {self.category}, Location: {self.location}, Rating: {self.rating}"
-
-        
\ No newline at end of file
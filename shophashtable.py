@@ -1,85 +1,149 @@
+from collections import ChainMap
+from itertools import islice
+from operator import attrgetter
+import heapq
+import metrics
+
+
 class ShopHashTable:
     def __init__(self):
         #Initializes a ShopHashTable, which is a hashtable storing shops categorized by their categories.
+        #Each category bucket maps shop number -> shop, so deletes and updates are O(1).
         self.table = {}
+        #Secondary indexes: location -> {number: shop} and rating band (whole stars) -> {number: shop}.
+        self.locations = {}
+        self.rating_bands = {}
+        #Where each shop number is filed: (category, location, rating). Kept separately because
+        #shops may be edited in place before the table is told about the change.
+        self.entries = {}
+
+    @staticmethod
+    def _band(rating):
+        return int(rating)
 
     def insert(self, shop):
-#Inserts a shop into the hashtable under its category.
-#Args: shop (Shop): The shop object to insert.
+#Inserts a shop into the hashtable under its category, location and rating band.
+#Args: shop (Shop): The shop object to insert. A shop already filed under the same number is replaced.
+        if shop.number in self.entries:
+            self._unfile(shop.number)
+
+        self.table.setdefault(shop.category, {})[shop.number] = shop
+        self.locations.setdefault(shop.location, {})[shop.number] = shop
+        self.rating_bands.setdefault(self._band(shop.rating), {})[shop.number] = shop
+        self.entries[shop.number] = (shop.category, shop.location, shop.rating)
 
-        if shop.category not in self.table:
-            self.table[shop.category] = []
-        self.table[shop.category].append(shop)
+    def insert_many(self, shops):
+#Inserts a batch of shops, e.g. a chunk read by Graph.load_csv.
+        for shop in shops:
+            self.insert(shop)
+
+    def _unfile(self, number):
+        #Removes a shop number from every index it is filed under.
+        category, location, rating = self.entries.pop(number)
+        for index, key in ((self.table, category), (self.locations, location),
+                           (self.rating_bands, self._band(rating))):
+            bucket = index[key]
+            del bucket[number]
+            # Remove buckets that are now empty.
+            if not bucket:
+                del index[key]
 
     def delete(self, shop):
 # Deletes a shop from the hashtable.
 #Args:shop (Shop): The shop object to delete.
 #Raises:ValueError: If the category does not exist or the shop is not found.
-        if shop.category in self.table:
-            if shop in self.table[shop.category]:
-                self.table[shop.category].remove(shop)
-                
-                # Check if the category list is now empty, and if so, remove the category.
-                if not self.table[shop.category]:
-                    del self.table[shop.category]
-            else:
-                # Shop not found in category, so we  exit the method
-                return
-        else:
+        if shop.number in self.entries:
+            self._unfile(shop.number)
+        elif shop.category not in self.table:
             raise ValueError(f"Category {shop.category} does not exist.")
+        # Otherwise the shop is not in the table, so we exit the method
+
+    def iter_search(self, category, offset=0, limit=None, sort_key=None, reverse=False):
+        # Quiet lookup: returns a lazy iterator over one page of a category without printing.
+        # sort_key is an attribute name such as "rating" or a key function; ties keep insertion order.
+        # An unsorted page is a live view, so finish iterating before changing the table.
+        bucket = self.table.get(category, {})
+        recorder = metrics.recorder
+        if recorder is not None:
+            recorder.observe("hashtable.bucket_size", len(bucket))
+        shops = bucket.values()
+        if sort_key is None:
+            return islice(shops, offset, None if limit is None else offset + limit)
+
+        key = attrgetter(sort_key) if isinstance(sort_key, str) else sort_key
+        if limit is None:
+            return iter(sorted(shops, key=key, reverse=reverse)[offset:])
+        # Only the first offset + limit shops need to be ordered
+        select = heapq.nlargest if reverse else heapq.nsmallest
+        return iter(select(offset + limit, shops, key=key)[offset:])
 
     def search(self, category):
-        # Searches for shops in a specific category.
-        shops_in_category = self.table.get(category, [])
-        
-        # If no shops are found for the given category
-        if not shops_in_category:
+        # Searches for shops in a specific category and displays them.
+        shops_in_category = list(self.iter_search(category))
+        self.display_shops(category, shops_in_category)
+        return shops_in_category
+
+    def display_shops(self, category, shops):
+        # Displays a list of shops from a category in a user-friendly format.
+        if not shops:
             print(f"No shops found for category '{category}'!")
-            return []
-        
-        # Displaying the shops in a user-friendly format
+            return
+
         print(f"Shops in category '{category}':")
-        for shop in shops_in_category:
+        for shop in shops:
             print(f"Shop Number: {shop.number}")
             print(f"Shop Name: {shop.name}")
             print(f"Location: {shop.location}")
             print(f"Rating: {shop.rating}\n")
-        
-        return shops_in_category
+
+    def query(self, category=None, location=None, min_rating=None):
+        # Returns the shops matching every given filter, e.g. query("Books", "North", 4).
+        # The smallest matching index is scanned and checked against the others.
+        if category is None and location is None and min_rating is None:
+            return [shop for shops in self.table.values() for shop in shops.values()]
+
+        filters = []  # (size, {number: shop}) for each given filter
+        if category is not None:
+            shops = self.table.get(category, {})
+            filters.append((len(shops), shops))
+        if location is not None:
+            shops = self.locations.get(location, {})
+            filters.append((len(shops), shops))
+        if min_rating is not None:
+            bands = [shops for band, shops in self.rating_bands.items() if band >= self._band(min_rating)]
+            filters.append((sum(map(len, bands)), ChainMap(*bands)))
+        filters.sort(key=lambda f: f[0])
+
+        driver = filters[0][1]
+        others = [shops for _, shops in filters[1:]]
+        entries = self.entries
+        recorder = metrics.recorder
+        if recorder is not None:
+            recorder.observe("hashtable.query.scan_length", filters[0][0])
+        return [shop for shop in driver.values()
+                if all(shop.number in shops for shops in others)
+                and (min_rating is None or entries[shop.number][2] >= min_rating)]
 
     def update(self, old_shop, new_shop):
         #Updates a shop in the hashtable by removing the old shop and inserting the new shop.
-        # If the category has changed, remove the shop from the old category first
-        if old_shop.category != new_shop.category:
-            if old_shop not in self.table.get(old_shop.category, []):
-                # Shop not found in category, so we silently exit the method
-                return
-        
-            self.table[old_shop.category].remove(old_shop)
-            # Check if the category list of old shop is now empty, and if so, remove the category.
-            if not self.table[old_shop.category]:
-                del self.table[old_shop.category]
-
-        # Now add the shop to the new category
+        #Only the shop number of old_shop is used, so an in-place edited shop can be passed as both.
+        if old_shop.number not in self.entries:
+            # Shop not found in the table, so we silently exit the method
+            return
+
+        self._unfile(old_shop.number)
         self.insert(new_shop)
+        recorder = metrics.recorder
+        if recorder is not None:
+            recorder.count("hashtable.updates")
 
     def display(self):
         #Displays all the shops in the hashtable, grouped by category.
         if not self.table:
             print("No shops to display!")
             return
-        
+
         for category, shops in self.table.items():
             print(f"Category: {category}")
-            for shop in shops:
+            for shop in shops.values():
                 print(f"\tShop Name: {shop.name}, Rating: {shop.rating}")
-
-
-
-
-   
-
-        
-
-
-
@@ -1,41 +1,221 @@
 import heapq
+from itertools import islice
+import metrics
+import time
 
 class ShopHeap:
     def __init__(self):
         self.heap = []
         self.counter = 0  
+        # Index of each shop number's entry in self.heap, for O(log n) updates and removals
+        self.positions = {}
+        # Shop numbers in each category, in insertion order, for per-category top-k queries,
+        # and the category each shop number is filed under
+        self.categories = {}
+        self.shop_categories = {}
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __contains__(self, shop_number):
+        return shop_number in self.positions
 
     def insert(self, shop):
-        heapq.heappush(self.heap, (-shop.rating, self.counter, shop))
+        if shop.number in self.positions:
+            raise ValueError(f"Shop {shop.number} is already in the heap!")
+        self.heap.append((-shop.rating, self.counter, shop))
+        self.positions[shop.number] = len(self.heap) - 1
+        self._categorize(shop.number, shop.category)
         self.counter += 1
+        self._sift_up(len(self.heap) - 1)
+
+    def insert_many(self, shops):
+        """Inserts a batch of shops. Large batches are heapified in O(n) instead of pushed one by one."""
+        shops = list(shops)
+        # Check the whole batch first so that a duplicate leaves the heap untouched
+        numbers = set()
+        for shop in shops:
+            if shop.number in self.positions or shop.number in numbers:
+                raise ValueError(f"Shop {shop.number} is already in the heap!")
+            numbers.add(shop.number)
+
+        if len(shops) < len(self.heap) // 8:
+            for shop in shops:
+                self.insert(shop)
+            return
+
+        # Only the new shops are filed by category, so earlier update_category calls stand
+        for shop in shops:
+            self.heap.append((-shop.rating, self.counter, shop))
+            self._categorize(shop.number, shop.category)
+            self.counter += 1
+        heapq.heapify(self.heap)
+        self._reposition()
+
+    def load_entries(self, entries, counter):
+        """Restores (priority, counter, shop) entries that are already in heap order."""
+        self.heap = list(entries)
+        self.counter = counter
+        self._reposition()
+        self.categories = {}
+        self.shop_categories = {}
+        for _, _, shop in sorted(self.heap, key=lambda entry: entry[1]):
+            self._categorize(shop.number, shop.category)
+
+    def _reposition(self):
+        self.positions = {entry[2].number: i for i, entry in enumerate(self.heap)}
+
+    def _move(self, entry, index):
+        self.heap[index] = entry
+        self.positions[entry[2].number] = index
+
+    def _sift_up(self, index):
+        heap = self.heap
+        entry = heap[index]
+        while index > 0:
+            parent = (index - 1) // 2
+            if not entry < heap[parent]:
+                break
+            self._move(heap[parent], index)
+            index = parent
+        self._move(entry, index)
+
+    def _sift_down(self, index):
+        heap = self.heap
+        size = len(heap)
+        entry = heap[index]
+        while True:
+            child = 2 * index + 1
+            if child >= size:
+                break
+            if child + 1 < size and heap[child + 1] < heap[child]:
+                child += 1
+            if not heap[child] < entry:
+                break
+            self._move(heap[child], index)
+            index = child
+        self._move(entry, index)
 
     def pop(self):
         if not self.heap:
             raise IndexError("The heap is empty. Cannot pop from an empty heap.")
-        _, _, shop = heapq.heappop(self.heap)
+        _, _, shop = self.heap[0]
+        self.remove(shop.number)
         return shop
 
+    def peek(self):
+        """Returns the highest rated shop without removing it."""
+        if not self.heap:
+            raise IndexError("The heap is empty. Cannot peek into an empty heap.")
+        return self.heap[0][2]
+
+    def remove(self, shop_number):
+        """Removes a shop from the heap in O(log n)."""
+        if shop_number not in self.positions:
+            raise ValueError(f"Shop {shop_number} is not in the heap!")
+        index = self.positions.pop(shop_number)
+        self._uncategorize(shop_number)
+        last = self.heap.pop()
+        if index < len(self.heap):
+            self._move(last, index)
+            self._sift_up(index)
+            self._sift_down(self.positions[last[2].number])
+
+    def update_priority(self, shop_number, rating):
+        """Moves a shop to its place for a new rating in O(log n), keeping its insertion order for ties."""
+        if shop_number not in self.positions:
+            raise ValueError(f"Shop {shop_number} is not in the heap!")
+        index = self.positions[shop_number]
+        _, counter, shop = self.heap[index]
+        self.heap[index] = (-rating, counter, shop)
+        self._sift_up(index)
+        self._sift_down(self.positions[shop_number])
+        recorder = metrics.recorder
+        if recorder is not None:
+            recorder.count("heap.priority_updates")
+            recorder.observe("heap.size", len(self.heap))
+
+    def _categorize(self, shop_number, category):
+        self.categories.setdefault(category, {})[shop_number] = None
+        self.shop_categories[shop_number] = category
+
+    def _uncategorize(self, shop_number):
+        category = self.shop_categories.pop(shop_number)
+        members = self.categories[category]
+        del members[shop_number]
+        if not members:
+            del self.categories[category]
+
+    def update_category(self, shop_number, category):
+        """Moves a shop to another category for top_k; call it when a shop's category changes."""
+        if shop_number not in self.positions:
+            raise ValueError(f"Shop {shop_number} is not in the heap!")
+        self._uncategorize(shop_number)
+        self._categorize(shop_number, category)
+
+    def top_k(self, k, category=None):
+        """Returns the k highest rated shops (optionally of one category) without popping them.
+        Ties keep insertion order, like pop."""
+        if category is not None:
+            # O(m log k) over the m shops of the category
+            heap, positions = self.heap, self.positions
+            entries = (heap[positions[number]] for number in self.categories.get(category, ()))
+            return [shop for _, _, shop in heapq.nsmallest(k, entries)]
+
+        return list(islice(self.iter_ranked(), k))
+
+    def iter_ranked(self):
+        """Yields every shop highest rated first (ties in insertion order), like popping
+        them all but without changing the heap. Taking the first k costs O(k log k)."""
+        # Walk the heap from the root, always taking the best unvisited entry
+        heap = self.heap
+        frontier = [(heap[0], 0)] if heap else []
+        while frontier:
+            entry, index = heapq.heappop(frontier)
+            yield entry[2]
+            for child in (2 * index + 1, 2 * index + 2):
+                if child < len(heap):
+                    heapq.heappush(frontier, (heap[child], child))
+
+    def rank(self, shop_numbers, limit=None):
+        """Returns the given shops in heap order (highest rated first, ties in insertion order),
+        keeping only the first limit of them when limit is given. Numbers not in the heap are skipped."""
+        heap, positions = self.heap, self.positions
+        entries = (heap[positions[number]] for number in shop_numbers if number in positions)
+        ranked = sorted(entries) if limit is None else heapq.nsmallest(limit, entries)
+        return [shop for _, _, shop in ranked]
+
     def clear(self):
         """Clears the heap."""
         self.heap = []
+        self.positions = {}
+        self.categories = {}
+        self.shop_categories = {}
 
     def sort_shops(self, shops):
         """Sorts a list of shops by rating in descending order."""
         sorted_shops = []
-        temp_heap = [(-shop.rating, shop) for shop in shops]
+        # The position breaks rating ties, so shops themselves are never compared
+        temp_heap = [(-shop.rating, i, shop) for i, shop in enumerate(shops)]
         heapq.heapify(temp_heap)
         
         while temp_heap:
-            _, shop = heapq.heappop(temp_heap)
+            _, _, shop = heapq.heappop(temp_heap)
             sorted_shops.append(shop)
 
         return sorted_shops
 
     def rebuild_heap(self, shops):
         """Clears and rebuilds the heap using the provided list of shops."""
+        recorder = metrics.recorder
+        if recorder is not None:
+            started = time.perf_counter()
         self.clear()
-        for shop in shops:
-            self.insert(shop)
+        self.insert_many(shops)
+        if recorder is not None:
+            recorder.count("heap.rebuilds")
+            recorder.observe("heap.rebuild.seconds", time.perf_counter() - started)
+            recorder.observe("heap.size", len(self.heap))
 
     def display_sorted(self, shops):
         """Displays the shops in sorted order by rating."""
@@ -0,0 +1,241 @@
+from csrgraph import CSRGraph
+from graph import Graph
+import metrics
+from nameindex import ShopNameIndex, normalize
+from numbers import Real
+from shop import Shop
+from shophashtable import ShopHashTable
+from shopheap import ShopHeap
+import threading
+
+
+class ShopStore:
+    # Shop attributes that can be changed with update()
+    ATTRIBUTES = ("name", "category", "location", "rating", "x", "y")
+
+    def __init__(self, graph=None, shop_table=None, shop_heap=None, cache_routes=False):
+        # Keeps the graph, hash table and heap consistent. Every operation is
+        # validated before anything is changed, so a failed edit leaves all three untouched.
+        self.graph = graph if graph is not None else Graph()
+        self.shop_table = shop_table if shop_table is not None else ShopHashTable()
+        self.shop_heap = shop_heap if shop_heap is not None else ShopHeap()
+        self.cache_routes = cache_routes
+        if cache_routes and isinstance(self.graph, Graph):
+            self.graph.enable_route_cache()
+        # The name index is built by the first name lookup; until then edits skip it
+        self._name_index = None
+        self._name_lock = threading.Lock()
+
+    @property
+    def name_index(self):
+        if self._name_index is None:
+            with self._name_lock:
+                if self._name_index is None:
+                    name_index = ShopNameIndex()
+                    name_index.insert_many(self.graph.shops.values())
+                    self._name_index = name_index
+        return self._name_index
+
+    def load_csv(self, shops_path, edges_path, chunk_size=10000):
+        # Graph.load_csv into all three structures, then index the new shop names
+        # if the name index is already built
+        name_index = self._name_index
+        known = set(self.graph.shops) if name_index is not None else None
+        errors = self.editable_graph().load_csv(shops_path, edges_path, self.shop_table, self.shop_heap, chunk_size)
+        if name_index is not None:
+            name_index.insert_many(shop for number, shop in self.graph.shops.items() if number not in known)
+        return errors
+
+    def editable_graph(self):
+        # Return the graph in editable form, converting a snapshot-backed graph on first use
+        if isinstance(self.graph, CSRGraph):
+            self.graph = self.graph.thaw()
+            if self.cache_routes:
+                self.graph.enable_route_cache()
+        return self.graph
+
+    def nearest(self, start, category, k=1, method="dijkstra"):
+        # Closest shops of a category, with the hash table's category index as the target set
+        candidates = self.shop_table.table.get(category, {})
+        return self.graph.nearest(start, category, k, method, candidates)
+
+    def autocomplete(self, prefix, limit=10):
+        # Shops whose name starts with prefix, highest rated first. A common prefix
+        # matches so many names that walking the heap from the top and keeping the
+        # matching ones finds the best few sooner than ranking every match; the walk
+        # gives up after as many steps as there are matches and ranks them instead.
+        name_index = self.name_index
+        lo, hi = name_index.prefix_range(prefix)
+        matches = hi - lo
+        shops = None
+        if limit is not None and matches * matches > limit * len(self.shop_heap):
+            text, entries = normalize(prefix), name_index.entries
+            shops = []
+            for steps, shop in enumerate(self.shop_heap.iter_ranked(), 1):
+                if entries.get(shop.number, "").startswith(text):
+                    shops.append(shop)
+                    if len(shops) == limit:
+                        break
+                if steps == matches:
+                    shops = None
+                    break
+        if shops is None:
+            steps = matches
+            shops = self.shop_heap.rank((number for _, number in name_index.names[lo:hi]), limit)
+        recorder = metrics.recorder
+        if recorder is not None:
+            recorder.observe("store.autocomplete.scanned", steps)
+        return shops
+
+    def find_by_name(self, name, limit=10, min_similarity=0.5):
+        # Shops whose name matches allowing for typos: closest names first, and
+        # equally close names highest rated first
+        matches = self.name_index.fuzzy(name, min_similarity, limit)
+        shops = self.shop_heap.rank(matches)
+        shops.sort(key=lambda shop: -matches[shop.number])
+        return shops[:limit]
+
+    def get(self, shop_number):
+        shop = self.graph.shops.get(shop_number)
+        if shop is None:
+            raise ValueError(f"Shop {shop_number} doesn't exist!")
+        return shop
+
+    def _check_values(self, values):
+        # Type-check shop attributes: the indexes hash, compare and normalise them,
+        # so a badly typed value would otherwise fail halfway through an edit
+        for attribute in ("name", "category", "location"):
+            if attribute in values and not isinstance(values[attribute], str):
+                raise ValueError(f"Shop {attribute} must be a string, got {values[attribute]!r}")
+        if "rating" in values:
+            rating = values["rating"]
+            if isinstance(rating, bool) or not isinstance(rating, Real):
+                raise ValueError(f"Rating must be a number, got {rating!r}")
+            if not 1 <= rating <= 5:
+                raise ValueError("Rating should be between 1 and 5!")
+        for attribute in ("x", "y"):
+            value = values.get(attribute)
+            if value is not None and (isinstance(value, bool) or not isinstance(value, Real)):
+                raise ValueError(f"Shop {attribute} must be a number or None, got {value!r}")
+
+    def _check_new_shop(self, shop):
+        if self.graph.has_vertex(shop.number) or shop.number in self.shop_heap:
+            raise ValueError(f"Shop {shop.number} already exists!")
+        self._check_values({attribute: getattr(shop, attribute) for attribute in self.ATTRIBUTES})
+
+    def add(self, shop):
+        self._check_new_shop(shop)
+        self.editable_graph().add_vertex(shop)
+        self.shop_table.insert(shop)
+        self.shop_heap.insert(shop)
+        if self._name_index is not None:
+            self._name_index.insert(shop)
+        return shop
+
+    def _check_changes(self, shop, changes):
+        # Validate an update and keep only the attributes whose value actually changes
+        for attribute, value in changes.items():
+            if attribute not in self.ATTRIBUTES:
+                raise ValueError(f"Invalid attribute: {attribute}")
+        self._check_values(changes)
+        return {attribute: value for attribute, value in changes.items() if getattr(shop, attribute) != value}
+
+    def update(self, shop_number, **changes):
+        # Edit a shop in place and refresh only the indexes affected by the change
+        shop = self.get(shop_number)
+        changes = self._check_changes(shop, changes)
+        for attribute, value in changes.items():
+            setattr(shop, attribute, value)
+
+        if "category" in changes or "location" in changes or "rating" in changes:
+            self.shop_table.update(shop, shop)
+        if "name" in changes and self._name_index is not None:
+            self._name_index.insert(shop)
+        if shop_number in self.shop_heap:
+            if "category" in changes:
+                self.shop_heap.update_category(shop_number, shop.category)
+            if "rating" in changes:
+                self.shop_heap.update_priority(shop_number, shop.rating)
+        return shop
+
+    def remove(self, shop_number):
+        # Only the lookup can fail; after it every structure is updated unconditionally
+        shop = self.get(shop_number)
+        self.editable_graph().remove_vertex(shop_number)
+        if shop_number in self.shop_table.entries:
+            self.shop_table.delete(shop)
+        if shop_number in self.shop_heap:
+            self.shop_heap.remove(shop_number)
+        if self._name_index is not None and shop_number in self._name_index:
+            self._name_index.delete(shop_number)
+        return shop
+
+    def connect(self, source, destination, weight=1):
+        self.editable_graph().add_edge(source, destination, weight)
+
+    def disconnect(self, source, destination):
+        self.editable_graph().remove_edge(source, destination)
+
+    def set_congestion(self, source, destination, multipliers):
+        self.editable_graph().set_congestion(source, destination, multipliers)
+
+    # Number of arguments after the action name that each batch edit takes
+    EDITS = {"add": (1, 1), "update": (2, 2), "remove": (1, 1), "connect": (2, 3), "disconnect": (2, 2)}
+
+    def _check_edit(self, edit):
+        if not isinstance(edit, (tuple, list)) or not edit:
+            raise ValueError(f"An edit must be a non-empty tuple, got {edit!r}")
+        action = edit[0]
+        if action not in self.EDITS:
+            raise ValueError(f"Unknown edit: {action}")
+        low, high = self.EDITS[action]
+        if not low <= len(edit) - 1 <= high:
+            raise ValueError(f"Edit {action} takes {low if low == high else f'{low} to {high}'} arguments, got {len(edit) - 1}")
+        if action == "add" and not isinstance(edit[1], Shop):
+            raise ValueError(f"Edit add needs a Shop, got {edit[1]!r}")
+        if action == "update" and not isinstance(edit[2], dict):
+            raise ValueError(f"Edit update needs a dict of changes, got {edit[2]!r}")
+        return action
+
+    def apply_batch(self, edits):
+        # Apply many edits in one call. Each edit is one of
+        #   ("add", shop), ("update", shop_number, {attribute: value}), ("remove", shop_number),
+        #   ("connect", source, destination[, weight]), ("disconnect", source, destination).
+        # Runs of consecutive adds are batch-inserted into the hash table and heap.
+        # Failed edits are skipped; returns the list of error messages. Shops added
+        # to the graph always reach the other indexes too, even if an edit raises.
+        errors = []
+        pending = []
+
+        def flush():
+            self.shop_table.insert_many(pending)
+            self.shop_heap.insert_many(pending)
+            if self._name_index is not None:
+                self._name_index.insert_many(pending)
+            pending.clear()
+
+        try:
+            for i, edit in enumerate(edits):
+                try:
+                    action = self._check_edit(edit)
+                    if action == "add":
+                        shop = edit[1]
+                        self._check_new_shop(shop)
+                        self.editable_graph().add_vertex(shop)
+                        pending.append(shop)
+                        continue
+
+                    flush()
+                    if action == "update":
+                        self.update(edit[1], **edit[2])
+                    elif action == "remove":
+                        self.remove(edit[1])
+                    elif action == "connect":
+                        self.connect(*edit[1:])
+                    else:
+                        self.disconnect(*edit[1:])
+                except (ValueError, TypeError) as e:
+                    errors.append(f"edit {i}: {e}")
+        finally:
+            flush()
+        return errors
@@ -0,0 +1,216 @@
+from array import array
+from collections.abc import Mapping
+from congestion import CongestionProfiles
+from csrgraph import CSRGraph
+from shop import Shop
+from shophashtable import ShopHashTable
+from shopheap import ShopHeap
+import math
+import mmap
+import struct
+import threading
+
+# File layout (native byte order, every section padded to 8 bytes):
+#   header   MAGIC, byte-order marker, vertex count, adjacency length,
+#            string pool size, heap size, heap counter, hash table size,
+#            congestion profile count, multiplier count
+#   graph    numbers q[n], offsets q[n + 1], neighbours q[m], weights d[m]
+#   shops    ratings d[n], x d[n], y d[n] (NaN when missing),
+#            string offsets q[3n + 1] into a UTF-8 pool of name, category, location
+#   heap     shop numbers q[h], counters q[h], priorities d[h] in heap order
+#   table    shop numbers q[t] in hash table bucket order
+#   profiles corridor ends q[2p] (pairs of shop numbers), slots q[p],
+#            multipliers d[v] (CongestionProfiles.values)
+MAGIC = b"SHOPSNP2"
+HEADER = struct.Struct("=8s9q")
+
+
+def _pad(size):
+    return (size + 7) & ~7
+
+
+def save_snapshot(path, graph, shop_table, shop_heap):
+    # Write the graph, hash table and heap to a single binary file.
+    # graph may be a Graph or a CSRGraph; every shop in the table and heap must be in it.
+    frozen = graph if isinstance(graph, CSRGraph) else graph.freeze()
+    numbers = frozen.numbers
+
+    ratings, xs, ys = array("d"), array("d"), array("d")
+    string_offsets = array("q", [0])
+    pool = bytearray()
+    for number in numbers:
+        shop = frozen.shops[number]
+        ratings.append(shop.rating)
+        xs.append(math.nan if shop.x is None else shop.x)
+        ys.append(math.nan if shop.y is None else shop.y)
+        for text in (shop.name, shop.category, shop.location):
+            pool += str(text).encode("utf-8")
+            string_offsets.append(len(pool))
+
+    heap_numbers, heap_counters, heap_priorities = array("q"), array("q"), array("d")
+    for priority, counter, shop in shop_heap.heap:
+        if not frozen.has_vertex(shop.number):
+            raise ValueError(f"Shop {shop.number} in the heap is not in the graph!")
+        heap_numbers.append(shop.number)
+        heap_counters.append(counter)
+        heap_priorities.append(priority)
+
+    table_numbers = array("q")
+    for shops in shop_table.table.values():
+        for shop in shops.values():
+            if not frozen.has_vertex(shop.number):
+                raise ValueError(f"Shop {shop.number} in the hash table is not in the graph!")
+            table_numbers.append(shop.number)
+
+    congestion = frozen.congestion
+    corridors, slots = array("q"), array("q")
+    for corridor, slot in congestion.slots.items():
+        corridors.extend(corridor)
+        slots.append(slot)
+    multipliers = array("d", congestion.values)
+
+    sections = [array("q", numbers), array("q", frozen.offsets), array("q", frozen.neighbours),
+                array("d", frozen.weights), ratings, xs, ys, string_offsets, bytes(pool),
+                heap_numbers, heap_counters, heap_priorities, table_numbers,
+                corridors, slots, multipliers]
+
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, 1, len(numbers), len(frozen.neighbours), len(pool),
+                            len(heap_numbers), shop_heap.counter, len(table_numbers),
+                            len(slots), len(multipliers)))
+        for section in sections:
+            data = section if isinstance(section, bytes) else section.tobytes()
+            f.write(data)
+            f.write(b"\0" * (_pad(len(data)) - len(data)))
+
+
+def load_snapshot(path):
+    # Map a snapshot file and return (CSRGraph, ShopHashTable, ShopHeap).
+    # The graph arrays are views straight into the mapped file, so route queries
+    # can be answered without parsing; use CSRGraph.thaw() before editing. Shops
+    # are decoded when first looked up, and the hash table and heap are filled the
+    # first time they are used.
+    with open(path, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(buffer)
+    if len(view) < HEADER.size:
+        raise ValueError(f"{path} is not a shop snapshot.")
+    magic, marker, n, m, pool_size, heap_size, counter, table_size, profiles, multipliers = HEADER.unpack_from(view)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a shop snapshot.")
+    if marker != 1:
+        raise ValueError(f"{path} was written on a machine with a different byte order.")
+
+    position = HEADER.size
+
+    def section(length, typecode):
+        nonlocal position
+        size = length * 8 if typecode else length
+        if position + size > len(view):
+            raise ValueError(f"{path} is truncated.")
+        data = view[position:position + size]
+        position += _pad(size)
+        return data.cast(typecode) if typecode else data
+
+    numbers = section(n, "q")
+    offsets = section(n + 1, "q")
+    neighbours = section(m, "q")
+    weights = section(m, "d")
+    ratings = section(n, "d")
+    xs = section(n, "d")
+    ys = section(n, "d")
+    string_offsets = section(3 * n + 1, "q")
+    pool = section(pool_size, None)
+    heap_numbers = section(heap_size, "q")
+    heap_counters = section(heap_size, "q")
+    heap_priorities = section(heap_size, "d")
+    table_numbers = section(table_size, "q")
+    corridors = section(2 * profiles, "q")
+    slots = section(profiles, "q")
+
+    # The multipliers stay in the mapped file like the graph arrays
+    congestion = CongestionProfiles()
+    congestion.slots = {(corridors[2 * i], corridors[2 * i + 1]): slot for i, slot in enumerate(slots)}
+    congestion.values = section(multipliers, "d")
+    graph = CSRGraph(numbers, offsets, neighbours, weights, None, congestion)
+    graph.shops = shops = _SnapshotShops(graph, ratings, xs, ys, string_offsets, pool)
+
+    def build_table():
+        shop_table = ShopHashTable()
+        shop_table.insert_many(shops[number] for number in table_numbers)
+        return shop_table
+
+    def build_heap():
+        # Entries were saved in heap order, so the list is already a valid heap
+        shop_heap = ShopHeap()
+        shop_heap.load_entries(((priority, heap_counter, shops[number])
+                                for number, heap_counter, priority in zip(heap_numbers, heap_counters, heap_priorities)),
+                               counter)
+        return shop_heap
+
+    return graph, _DeferredTable.deferred(build_table), _DeferredHeap.deferred(build_heap)
+
+
+class _SnapshotShops(Mapping):
+    # The shops of a mapped snapshot, read-only like the graph they belong to. A Shop
+    # is decoded from the mapped columns the first time it is looked up and then
+    # kept, so every lookup of a number returns the same object (readers racing on a
+    # first lookup agree through setdefault).
+    def __init__(self, graph, ratings, xs, ys, string_offsets, pool):
+        self.graph = graph
+        self.ratings, self.xs, self.ys = ratings, xs, ys
+        self.string_offsets = string_offsets
+        self.pool = pool
+        self.decoded = {}
+
+    def __len__(self):
+        return len(self.graph.numbers)
+
+    def __iter__(self):
+        return iter(self.graph.numbers)
+
+    def __contains__(self, number):
+        return self.graph._find(number) is not None
+
+    def __getitem__(self, number):
+        shop = self.decoded.get(number)
+        if shop is not None:
+            return shop
+        i = self.graph._find(number)
+        if i is None:
+            raise KeyError(number)
+        offsets, pool = self.string_offsets, self.pool
+        name, category, location = (str(pool[offsets[j]:offsets[j + 1]], "utf-8") for j in range(3 * i, 3 * i + 3))
+        rating, x, y = self.ratings[i], self.xs[i], self.ys[i]
+        shop = Shop(number, name, category, location, int(rating) if rating.is_integer() else rating,
+                    None if math.isnan(x) else x, None if math.isnan(y) else y)
+        return self.decoded.setdefault(number, shop)
+
+
+class _Deferred:
+    # A ShopHashTable or ShopHeap that is filled on first use, so that loading a
+    # snapshot to answer routes never decodes the shops behind them. The instance
+    # starts without any attributes; the first lookup of one ends up in __getattr__,
+    # which builds the real structure under a lock and adopts its attributes.
+    @classmethod
+    def deferred(cls, build):
+        instance = cls.__new__(cls)
+        instance.__dict__.update(_build=build, _lock=threading.Lock())
+        return instance
+
+    def __getattr__(self, name):
+        if name.startswith("__") or "_lock" not in self.__dict__:
+            raise AttributeError(name)
+        with self._lock:
+            if self._build is not None:
+                self.__dict__.update(self._build().__dict__)
+                self._build = None
+        return object.__getattribute__(self, name)
+
+
+class _DeferredTable(_Deferred, ShopHashTable):
+    pass
+
+
+class _DeferredHeap(_Deferred, ShopHeap):
+    pass
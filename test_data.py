@@ -3,7 +3,22 @@ from shop import Shop
 from graph import Graph
 from shophashtable import ShopHashTable
 from shopheap import ShopHeap
+from snapshot import save_snapshot, load_snapshot
+from shopstore import ShopStore
+from nameindex import normalize, trigrams
+from parallel import parallel_distance_matrix
+from server import ShopServer
+from commands import execute, is_write
+from main import MainApp
+from benchmark import generate_mall, run_benchmark, write_csv
+import metrics
+import datetime
+import io
+import asyncio
+import json
 import csv
+import random
+from concurrent.futures import ThreadPoolExecutor
 
 # Setup fixture to create a graph object for each test
 @pytest.fixture
@@ -11,16 +26,8 @@ def setup_graph():
     graph = Graph()
 
     # Using relative paths for CSV files
-    with open("./shops.csv", "r") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            shop = Shop(int(row['number']), row['name'], row['category'], row['location'], int(row['rating']))
-            graph.add_vertex(shop)
-    
-    with open("./edges.csv", "r") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            graph.add_edge(int(row['source']), int(row['destination']))
+    errors = graph.load_csv("./shops.csv", "./edges.csv")
+    assert errors == []
 
     return graph
 
@@ -68,6 +75,22 @@ def test_dfs_path(setup_graph):
     assert path[-1] == 5
     print(f"Path found using DFS: {path}")
 
+def test_lazy_traversals(setup_graph):
+    print("Walking the graph lazily...")
+    assert list(setup_graph.iter_dfs(1)) == [(1, 0), (3, 1), (5, 2), (2, 2), (4, 3)]
+    assert setup_graph.dfs(1, 5) == [1, 3, 5]
+    assert list(setup_graph.iter_bfs(1)) == [(1, 0), (2, 1), (3, 1), (4, 2), (5, 2)]
+    assert list(setup_graph.iter_bfs(1, max_hops=1)) == [(1, 0), (2, 1), (3, 1)]
+    # Stopping early leaves the rest of the graph unexplored
+    levels = setup_graph.iter_bfs(4)
+    assert next(levels) == (4, 0) and next(levels) == (2, 1)
+    assert not setup_graph.within_hops(4, 5, 2) and setup_graph.within_hops(4, 5, 3)
+    assert setup_graph.iddfs(4, 5) == [4, 2, 3, 5]
+    assert setup_graph.iddfs(4, 5, max_depth=2) == [] and setup_graph.iddfs(4, 4) == [4]
+    setup_graph.add_vertex(Shop(6, "ShopF", "Toys", "Annex", 3))
+    assert setup_graph.iddfs(1, 6) == [] and not setup_graph.within_hops(1, 6, 10)
+    print("Lazy traversals and iterative deepening checked!")
+
 def test_bfs_path(setup_graph):
     print("Finding a path using BFS from ShopA to ShopE...")
     path = setup_graph.bfs(1, 5)
@@ -220,10 +243,931 @@ def test_heap_rebuild(setup_shop_heap):
     print(f"-> Popped shop after rebuilding: {top_shop.name} (Rating: {top_shop.rating})")
     assert top_shop.name == "ShopE", f"Expected ShopE but got {top_shop.name}"
 
+def test_shortest_path_uses_walking_distance():
+    print("\nFinding the cheapest route when the fewest hops is the longer walk...")
+    graph = Graph()
+    for number in range(1, 5):
+        graph.add_vertex(Shop(number, f"Shop{number}", "Books", "North", 4))
+    graph.add_edge(1, 4, 100)
+    graph.add_edge(1, 2, 10)
+    graph.add_edge(2, 3, 10)
+    graph.add_edge(3, 4, 10)
+    path = graph.shortest_path(1, 4)
+    print(f"-> Cheapest path: {path} (distance {graph.path_cost(path)})")
+    assert path == [1, 2, 3, 4]
+    assert graph.path_cost(path) == 30
+    assert graph.bfs(1, 4) == [1, 4]
+
+def test_astar_matches_dijkstra():
+    print("\nComparing A* and Dijkstra on a small grid with coordinates...")
+    graph = Graph()
+    for row in range(3):
+        for col in range(3):
+            number = row * 3 + col + 1
+            graph.add_vertex(Shop(number, f"Shop{number}", "Food", "Center", 3, x=col * 10, y=row * 10))
+    for row in range(3):
+        for col in range(3):
+            number = row * 3 + col + 1
+            if col < 2:
+                graph.add_edge(number, number + 1, 10)
+            if row < 2:
+                graph.add_edge(number, number + 3, 10)
+    dijkstra_path = graph.shortest_path(1, 9)
+    astar_path = graph.shortest_path(1, 9, method="astar")
+    print(f"-> Dijkstra: {dijkstra_path}, A*: {astar_path}")
+    assert graph.path_cost(astar_path) == graph.path_cost(dijkstra_path) == 40
+
+def test_astar_with_partial_coordinates():
+    print("\nRouting with A* when only some shops have coordinates...")
+    graph = Graph()
+    graph.add_vertex(Shop(1, "Entrance", "Food", "Center", 3))
+    graph.add_vertex(Shop(2, "Atrium", "Food", "Center", 3, x=30, y=0))
+    graph.add_vertex(Shop(3, "Stairs", "Food", "Center", 3))
+    graph.add_vertex(Shop(4, "Cinema", "Food", "Center", 3, x=0, y=0))
+    graph.add_vertex(Shop(5, "Lift", "Food", "Center", 3))
+    graph.add_edge(1, 3, 10)
+    graph.add_edge(1, 2, 1)
+    graph.add_edge(2, 3, 1)
+    graph.add_edge(3, 4, 50)
+    graph.add_edge(1, 5, 55)
+    graph.add_edge(5, 4, 1)
+    # Shop 3 is expanded the long way first; once the detour through 2 is found it
+    # must be expanded again, or the route through 5 looks cheapest
+    assert graph.shortest_path(1, 4, "astar") == graph.shortest_path(1, 4) == [1, 2, 3, 4]
+    assert graph.freeze().shortest_path(1, 4, "astar") == [1, 2, 3, 4]
+
+def test_invalid_route_options(setup_graph):
+    print("\nTrying an unknown routing method and a non-positive walking distance...")
+    with pytest.raises(ValueError):
+        setup_graph.shortest_path(1, 5, method="teleport")
+    with pytest.raises(ValueError):
+        setup_graph.add_edge(4, 5, 0)
+    print("Expected errors raised!")
+
+def test_route_cache_hits_and_invalidation(setup_graph):
+    print("\nCaching routes and invalidating them on graph changes...")
+    cache = setup_graph.enable_route_cache(max_entries=8)
+    first = setup_graph.bfs(1, 5)
+    assert setup_graph.bfs(1, 5) == first
+    assert cache.hits == 1 and cache.misses == 1
+    # Removing an edge that the cached route does not use keeps the entry
+    setup_graph.remove_edge(2, 4)
+    assert setup_graph.bfs(1, 5) == first
+    assert cache.hits == 2
+    # Removing an edge on the route drops it
+    setup_graph.remove_edge(3, 5)
+    assert (1, 5, "bfs") not in cache.entries
+    # Shop 5 is now cut off, which the component index answers without a lookup
+    assert setup_graph.bfs(1, 5) == []
+    assert cache.misses == 1
+    setup_graph.add_edge(1, 5)
+    assert setup_graph.bfs(1, 5) == [1, 5]
+    print(f"-> Cache stats: {cache.stats()}")
+
+def test_route_cache_keeps_other_components(setup_graph):
+    print("\nKeeping cached routes in components a new edge does not touch...")
+    for number, name in ((6, "ShopF"), (7, "ShopG"), (8, "ShopH")):
+        setup_graph.add_vertex(Shop(number, name, "Toys", "Northeast", 3))
+    setup_graph.add_edge(6, 7)
+    cache = setup_graph.enable_route_cache()
+    setup_graph.bfs(1, 5)
+    setup_graph.bfs(6, 7)
+    # Joining 8 to the 6-7 component can only change routes there
+    setup_graph.add_edge(7, 8)
+    assert (1, 5, "bfs") in cache.entries
+    assert (6, 7, "bfs") not in cache.entries
+    setup_graph.add_edge(4, 5)
+    assert (1, 5, "bfs") not in cache.entries
+    assert setup_graph.bfs(6, 8) == [6, 7, 8]
+
+def test_route_cache_lru_bound(setup_graph):
+    print("\nChecking that the route cache evicts the least recently used route...")
+    cache = setup_graph.enable_route_cache(max_entries=2)
+    setup_graph.bfs(1, 5)
+    setup_graph.bfs(1, 4)
+    setup_graph.bfs(1, 5)
+    setup_graph.bfs(2, 5)
+    assert (1, 4, "bfs") not in cache.entries
+    assert (1, 5, "bfs") in cache.entries
+    assert len(cache) == 2
+
+def test_route_cache_precompute(setup_graph):
+    print("\nPrecomputing BFS trees for every source...")
+    cache = setup_graph.enable_route_cache(precompute="bfs")
+    assert setup_graph.bfs(4, 5) == [4, 2, 3, 5]
+    assert cache.misses == 0
+    # A shortcut edge drops the trees it makes stale
+    setup_graph.add_edge(4, 3)
+    assert cache.stats()["trees"] < 5
+    assert setup_graph.bfs(4, 5) == [4, 3, 5]
+
+def test_frozen_graph_matches_graph(setup_graph):
+    print("\nFreezing the graph into CSR form and comparing routes...")
+    frozen = setup_graph.freeze()
+    for start in setup_graph.adj_list:
+        for end in setup_graph.adj_list:
+            assert frozen.bfs(start, end) == setup_graph.bfs(start, end)
+            assert frozen.dfs(start, end) == setup_graph.dfs(start, end)
+            assert frozen.shortest_path(start, end) == setup_graph.shortest_path(start, end)
+    assert frozen.edge_count() == 5
+    assert frozen.path_cost(frozen.shortest_path(1, 5)) == setup_graph.path_cost(setup_graph.shortest_path(1, 5))
+    with pytest.raises(ValueError):
+        frozen.add_edge(4, 5)
+    with pytest.raises(ValueError):
+        frozen.bfs(1, 100)
+
+def test_frozen_graph_is_compact(setup_graph):
+    print("\nChecking the memory layout of a frozen graph...")
+    frozen = setup_graph.freeze()
+    # Shops 1-5 are consecutive: no number array and no lookup dict are kept
+    assert frozen.numbers == range(1, 6) and frozen.index is None
+    assert frozen.shops is setup_graph.shops
+    assert all(array.itemsize == 4 for array in (frozen.offsets, frozen.neighbours, frozen.weights))
+    # Gaps in the numbers are looked up by binary search
+    setup_graph.add_vertex(Shop(1000, "ShopZ", "Toys", "Annex", 3))
+    setup_graph.add_edge(5, 1000, 12.5)
+    frozen = setup_graph.freeze()
+    assert list(frozen.numbers) == [1, 2, 3, 4, 5, 1000] and frozen.index is None
+    assert frozen.shortest_path(1, 1000) == setup_graph.shortest_path(1, 1000)
+    assert frozen.has_vertex(1000) and not frozen.has_vertex(999) and not frozen.has_vertex("1")
+    # Walking distances that a 32-bit float would round stay 64-bit
+    setup_graph.add_edge(4, 1000, 0.1)
+    assert setup_graph.freeze().weights.itemsize == 8
+    assert setup_graph.freeze().edge_weight(4, 1000) == 0.1
+
+def test_thaw_frozen_graph(setup_graph):
+    print("\nThawing a frozen graph back into a mutable one...")
+    graph = setup_graph.freeze().thaw()
+    assert graph.adj_list == setup_graph.adj_list
+    graph.add_edge(4, 5)
+    assert graph.has_vertex(5)
+
+def test_remove_vertex_keeps_neighbour_order(setup_graph):
+    print("\nRemoving a shop and checking the remaining neighbour order...")
+    setup_graph.add_edge(4, 5)
+    setup_graph.add_edge(1, 4)
+    setup_graph.remove_vertex(2)
+    assert list(setup_graph.adj_list[1]) == [3, 4]
+    assert list(setup_graph.adj_list[4]) == [5, 1]
+    assert all(2 not in neighbours for neighbours in setup_graph.adj_list.values())
+
+def test_bidirectional_shortest_path(setup_graph):
+    print("\nFinding fewest-hop paths with bidirectional BFS...")
+    for start in setup_graph.adj_list:
+        for end in setup_graph.adj_list:
+            path = setup_graph.shortest_path(start, end, method="bidirectional")
+            assert path[0] == start and path[-1] == end
+            assert len(path) == len(setup_graph.bfs(start, end))
+            assert all(b in setup_graph.adj_list[a] for a, b in zip(path, path[1:]))
+    assert setup_graph.freeze().shortest_path(4, 5, method="bidirectional") == [4, 2, 3, 5]
+    setup_graph.add_vertex(Shop(6, "ShopF", "Toys", "Northeast", 3))
+    assert setup_graph.shortest_path(1, 6, method="bidirectional") == []
+
+def test_load_csv_reports_malformed_rows(tmp_path):
+    print("\nBulk-loading CSV files that contain malformed rows...")
+    shops_path = tmp_path / "shops.csv"
+    edges_path = tmp_path / "edges.csv"
+    shops_path.write_text("number,name,category,location,rating\n"
+                          "1,ShopA,Electronics,East,4\n"
+                          "2,ShopB,Clothing,West,9\n"
+                          "x,ShopC,Books,North,5\n"
+                          "3,ShopC,Books,North,4.5\n"
+                          "1,ShopA,Electronics,East,4\n"
+                          "4,ShopD,Food\n")
+    edges_path.write_text("source,destination,weight\n"
+                          "1,3,12\n"
+                          "1,2,5\n"
+                          "3,1,7\n"
+                          "3,3,1\n"
+                          "1,3\n")
+    shop_table = ShopHashTable()
+    shop_heap = ShopHeap()
+    graph = Graph()
+    errors = graph.load_csv(shops_path, edges_path, shop_table, shop_heap, chunk_size=2)
+    for error in errors:
+        print(f"-> {error}")
+    assert len(errors) == 8
+    assert sorted(graph.shops) == [1, 3]
+    assert graph.adj_list[1] == {3: 12}
+    assert graph.shops[3].rating == 4.5
+    assert list(shop_table.table["Books"]) == [3]
+    assert shop_heap.pop().number == 3
+
+def test_snapshot_round_trip(setup_graph, setup_hash_table, setup_shop_heap, tmp_path):
+    print("\nSaving and mapping a binary snapshot...")
+    setup_graph.shops[3].x, setup_graph.shops[3].y = 2.5, 7
+    path = tmp_path / "mall.snapshot"
+    save_snapshot(path, setup_graph, setup_hash_table, setup_shop_heap)
+    graph, shop_table, shop_heap = load_snapshot(path)
+    assert graph.shortest_path(1, 5) == setup_graph.shortest_path(1, 5)
+    assert graph.bfs(4, 5) == setup_graph.bfs(4, 5)
+    assert (graph.shops[3].x, graph.shops[3].y, graph.shops[1].x) == (2.5, 7, None)
+    assert graph.shops[3] == setup_graph.shops[3]
+    assert list(shop_table.table) == list(setup_hash_table.table)
+    assert [shop.number for shop in shop_table.search("Books")] == [3]
+    assert [shop_heap.pop().number for _ in range(5)] == [setup_shop_heap.pop().number for _ in range(5)]
+    thawed = graph.thaw()
+    thawed.remove_vertex(3)
+    assert thawed.bfs(1, 5) == []
+
+def test_snapshot_loads_lazily(setup_graph, setup_hash_table, setup_shop_heap, tmp_path):
+    print("\nMapping a snapshot without decoding its shops...")
+    path = tmp_path / "mall.snapshot"
+    save_snapshot(path, setup_graph, setup_hash_table, setup_shop_heap)
+    store = ShopStore(*load_snapshot(path))
+    # Routes need neither the shops nor the hash table, heap or name index
+    assert store.graph.shortest_path(1, 5) == setup_graph.shortest_path(1, 5)
+    assert store.graph.shops.decoded == {} and store._name_index is None
+    assert "heap" not in store.shop_heap.__dict__ and "table" not in store.shop_table.__dict__
+    assert len(store.graph.shops) == 5 and 3 in store.graph.shops and 6 not in store.graph.shops
+    # Concurrent first uses all see the same, fully built structures
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        tops = list(pool.map(lambda _: [shop.number for shop in store.shop_heap.top_k(5)], range(8)))
+        names = list(pool.map(lambda _: [shop.number for shop in store.autocomplete("shop")], range(8)))
+    assert tops == [[3, 5, 1, 2, 4]] * 8 and names == [[3, 5, 1, 2, 4]] * 8
+    assert store.shop_table.table["Books"][3] is store.graph.shops[3] is store.shop_heap.peek()
+    store.update(3, rating=1)
+    assert store.shop_heap.peek().number == 5 and store.shop_table.query("Books", min_rating=2) == []
+
+def test_load_invalid_snapshot(tmp_path):
+    print("\nLoading a file that is not a snapshot...")
+    path = tmp_path / "shops.csv"
+    path.write_text("number,name,category,location,rating\n" * 10)
+    with pytest.raises(ValueError):
+        load_snapshot(path)
+
+def test_hash_table_query_indexes(setup_hash_table):
+    print("\nQuerying shops by category, location and minimum rating...")
+    setup_hash_table.insert(Shop(6, "ShopF", "Books", "North", 3.5))
+    setup_hash_table.insert(Shop(7, "ShopG", "Books", "South", 4.5))
+    setup_hash_table.insert(Shop(8, "ShopH", "Books", "North", 4.2))
+    assert [shop.number for shop in setup_hash_table.query("Books", "North", 4)] == [3, 8]
+    assert [shop.number for shop in setup_hash_table.query("Books", min_rating=4.3)] == [3, 7]
+    assert [shop.number for shop in setup_hash_table.query(location="North")] == [3, 6, 8]
+    assert sorted(shop.number for shop in setup_hash_table.query(min_rating=5)) == [3, 5]
+    assert setup_hash_table.query("Books", "Center") == []
+    assert len(setup_hash_table.query()) == 8
+
+def test_hash_table_update_reindexes_in_place_edit(setup_hash_table):
+    print("\nEditing a shop in place and refreshing the indexes...")
+    shop_c = setup_hash_table.table["Books"][3]
+    shop_c.location, shop_c.rating = "East", 2
+    setup_hash_table.update(shop_c, shop_c)
+    assert setup_hash_table.query("Books", "North") == []
+    assert setup_hash_table.query("Books", "East", 2) == [shop_c]
+    assert setup_hash_table.query("Books", min_rating=3) == []
+    setup_hash_table.delete(shop_c)
+    assert "Books" not in setup_hash_table.table and "East" in setup_hash_table.locations
+
+def test_hash_table_iter_search_pages(setup_hash_table, capsys):
+    print("\nPaging through a category without printing...")
+    for number, rating in ((6, 3), (7, 4.5), (8, 1), (9, 4.5)):
+        setup_hash_table.insert(Shop(number, f"Shop{number}", "Books", "North", rating))
+    capsys.readouterr()
+    assert [shop.number for shop in setup_hash_table.iter_search("Books")] == [3, 6, 7, 8, 9]
+    assert [shop.number for shop in setup_hash_table.iter_search("Books", offset=1, limit=2)] == [6, 7]
+    by_rating = setup_hash_table.iter_search("Books", offset=1, limit=3, sort_key="rating", reverse=True)
+    assert [shop.number for shop in by_rating] == [7, 9, 6]
+    by_number = setup_hash_table.iter_search("Books", sort_key=lambda shop: shop.number, reverse=True)
+    assert [shop.number for shop in by_number] == [9, 8, 7, 6, 3]
+    assert list(setup_hash_table.iter_search("Garden")) == []
+    assert capsys.readouterr().out == ""
+
+def test_heap_update_priority_remove_and_peek(setup_shop_heap):
+    print("\n[Test: Update Priority, Remove and Peek]")
+    assert setup_shop_heap.peek().name == "ShopC"
+    setup_shop_heap.update_priority(4, 5)
+    setup_shop_heap.update_priority(3, 1)
+    setup_shop_heap.remove(5)
+    assert 5 not in setup_shop_heap
+    with pytest.raises(ValueError):
+        setup_shop_heap.remove(5)
+    with pytest.raises(ValueError):
+        setup_shop_heap.insert(Shop(1, "ShopA", "Electronics", "East", 4))
+    order = [setup_shop_heap.pop().name for _ in range(len(setup_shop_heap))]
+    print(f"-> Pop order after updates: {order}")
+    assert order == ["ShopD", "ShopA", "ShopB", "ShopC"]
+    assert setup_shop_heap.positions == {}
+
+def test_heap_positions_stay_consistent():
+    print("\n[Test: Heap Positions]")
+    import random
+    rng = random.Random(7)
+    heap = ShopHeap()
+    heap.insert_many(Shop(n, f"Shop{n}", "Food", "Center", rng.randint(1, 5)) for n in range(200))
+    ratings = {n: heap.heap[heap.positions[n]][2].rating for n in range(200)}
+    for _ in range(300):
+        number = rng.choice(list(ratings))
+        if rng.random() < 0.3:
+            heap.remove(number)
+            del ratings[number]
+        else:
+            ratings[number] = rng.randint(1, 5)
+            heap.update_priority(number, ratings[number])
+        assert all(heap.heap[i][2].number == n for n, i in heap.positions.items())
+    popped = []
+    while heap.heap:
+        popped.append(-heap.heap[0][0])
+        heap.pop()
+    assert popped == sorted(ratings.values(), reverse=True)
+
+def test_heap_top_k(setup_shop_heap):
+    print("\n[Test: Top-k]")
+    setup_shop_heap.insert(Shop(6, "ShopF", "Books", "North", 4))
+    setup_shop_heap.insert(Shop(7, "ShopG", "Books", "South", 5))
+    top = setup_shop_heap.top_k(3)
+    print(f"-> Top 3 shops: {[shop.name for shop in top]}")
+    assert [shop.number for shop in top] == [3, 5, 7]
+    assert [shop.number for shop in setup_shop_heap.top_k(10, "Books")] == [3, 7, 6]
+    assert [shop.number for shop in setup_shop_heap.top_k(2, "Books")] == [3, 7]
+    assert setup_shop_heap.top_k(3, "Garden") == []
+    assert len(setup_shop_heap.top_k(100)) == 7
+    # top_k does not pop anything
+    assert len(setup_shop_heap) == 7
+    setup_shop_heap.update_category(6, "Toys")
+    assert [shop.number for shop in setup_shop_heap.top_k(10, "Books")] == [3, 7]
+    setup_shop_heap.remove(7)
+    assert [shop.number for shop in setup_shop_heap.top_k(10, "Books")] == [3]
+    # A heapified batch files only the new shops and keeps the move of shop 6
+    setup_shop_heap.insert_many([Shop(8, "ShopH", "Books", "East", 2), Shop(9, "ShopI", "Toys", "West", 5)])
+    assert [shop.number for shop in setup_shop_heap.top_k(10, "Books")] == [3, 8]
+    assert [shop.number for shop in setup_shop_heap.top_k(10, "Toys")] == [9, 6]
+    assert setup_shop_heap.top_k(1)[0].number == 3 and setup_shop_heap.pop().number == 3
 
+@pytest.fixture
+def setup_store(setup_graph):
+    shop_table = ShopHashTable()
+    shop_heap = ShopHeap()
+    shop_table.insert_many(setup_graph.shops.values())
+    shop_heap.insert_many(setup_graph.shops.values())
+    return ShopStore(setup_graph, shop_table, shop_heap)
+
+def test_store_update_keeps_structures_consistent(setup_store):
+    print("\nUpdating a shop through the store...")
+    shop = setup_store.update(4, category="Books", rating=5, location="North")
+    assert setup_store.graph.shops[4] is shop
+    assert [s.number for s in setup_store.shop_table.query("Books", "North", 5)] == [3, 4]
+    assert [s.number for s in setup_store.shop_heap.top_k(2, "Books")] == [3, 4]
+    assert "Food" not in setup_store.shop_table.table
+    # A rejected update changes nothing
+    with pytest.raises(ValueError):
+        setup_store.update(4, name="ShopX", rating=9)
+    with pytest.raises(ValueError):
+        setup_store.update(4, floor=2)
+    assert shop.name == "ShopD"
+
+def test_store_add_and_remove(setup_store):
+    print("\nAdding and removing a shop through the store...")
+    setup_store.add(Shop(6, "ShopF", "Toys", "Northeast", 5))
+    setup_store.connect(6, 5, 20)
+    assert setup_store.graph.shortest_path(1, 6) == [1, 3, 5, 6]
+    with pytest.raises(ValueError):
+        setup_store.add(Shop(6, "ShopF", "Toys", "Northeast", 5))
+    setup_store.remove(3)
+    assert 3 not in setup_store.shop_heap and 3 not in setup_store.shop_table.entries
+    assert setup_store.graph.bfs(1, 6) == []
+    with pytest.raises(ValueError):
+        setup_store.remove(3)
+
+def test_store_apply_batch(setup_store):
+    print("\nApplying a batch of edits through the store...")
+    errors = setup_store.apply_batch([
+        ("add", Shop(6, "ShopF", "Toys", "Northeast", 2)),
+        ("add", Shop(7, "ShopG", "Toys", "Northeast", 4)),
+        ("add", Shop(6, "ShopF", "Toys", "Northeast", 2)),
+        ("connect", 6, 7),
+        ("update", 6, {"rating": 4.5}),
+        ("remove", 1),
+        ("remove", 100),
+        ("teleport", 1),
+    ])
+    print(f"-> Errors: {errors}")
+    assert len(errors) == 3
+    assert [s.number for s in setup_store.shop_heap.top_k(2, "Toys")] == [6, 7]
+    assert setup_store.graph.bfs(6, 7) == [6, 7]
+    assert not setup_store.graph.has_vertex(1) and 1 not in setup_store.shop_heap
+
+def test_shop_slots_and_stable_hash():
+    print("\nChecking the compact Shop record...")
+    import copy
+    shop = Shop(1, "ShopA", "Electronics", "East", 4)
+    assert not hasattr(shop, "__dict__")
+    shops = {shop}
+    shop.rating = 5
+    shop.name = "ShopA2"
+    # The hash follows the shop number, so an edited shop is still found
+    assert shop in shops
+    assert hash(shop) == hash(Shop(1, "Other", "Books", "West", 2))
+    assert shop != Shop(1, "Other", "Books", "West", 2)
+    clone = copy.copy(shop)
+    assert clone == shop and clone is not shop and hash(clone) == hash(shop)
+    with pytest.raises(AttributeError):
+        shop.floor = 2
+
+def test_routes_from_many_targets(setup_graph):
+    print("\nRouting from one shop to several exits with one search...")
+    setup_graph.add_vertex(Shop(6, "ShopF", "Toys", "Northeast", 3))
+    tree = setup_graph.routes_from(1, [4, 5, 6])
+    assert tree.path(5) == setup_graph.shortest_path(1, 5)
+    assert tree.distance(4) == setup_graph.path_cost(setup_graph.shortest_path(1, 4))
+    assert 6 not in tree and tree.path(6) == [] and tree.distance(6) is None
+    hops = setup_graph.routes_from(4, method="bfs")
+    assert hops.path(5) == [4, 2, 3, 5] and hops.distance(5) == 3
+    with pytest.raises(ValueError):
+        setup_graph.routes_from(1, [100])
+
+def test_distance_matrix(setup_graph):
+    print("\nComputing a distance matrix from several kiosks...")
+    matrix = setup_graph.distance_matrix([1, 4], [5, 1, 2])
+    print(f"-> Matrix: {matrix}")
+    assert matrix == [[110, 0, 40], [130, 95, 55]]
+    assert setup_graph.distance_matrix([4], [5], method="bfs") == [[3]]
+
+def test_parallel_distance_matrix(setup_graph, tmp_path):
+    print("\nWriting a hop-count matrix with a process pool...")
+    setup_graph.add_vertex(Shop(6, "ShopF", "Toys", "Northeast", 3))
+    path = tmp_path / "matrix.csv"
+    written = parallel_distance_matrix(setup_graph, path, targets=[5, 1, 6], workers=2, chunk_size=2)
+    assert written == 6
+    with open(path) as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == ["source", "5", "1", "6"]
+    for row in rows[1:]:
+        source = int(row[0])
+        expected = setup_graph.distance_matrix([source], [5, 1, 6], method="bfs")[0]
+        assert row[1:] == ["" if d is None else str(d) for d in expected]
+
+def test_query_server(setup_store):
+    print("\nServing concurrent kiosk queries over a local socket...")
+
+    async def request(address, commands):
+        reader, writer = await asyncio.open_connection(*address)
+        responses = []
+        for command in commands:
+            writer.write(json.dumps(command).encode() + b"\n")
+            await writer.drain()
+            responses.append(json.loads(await reader.readline()))
+        writer.close()
+        await writer.wait_closed()
+        return responses
+
+    async def scenario():
+        server = ShopServer(setup_store)
+        await server.start()
+        routes = [{"op": "route", "source": 1, "destination": 5, "id": i} for i in range(10)]
+        edits = [{"op": "add_shop", "number": 6, "name": "ShopF", "category": "Toys", "location": "Northeast", "rating": 4},
+                 {"op": "add_connection", "source": 6, "destination": 5, "weight": 10},
+                 {"op": "route", "source": 6, "destination": 1},
+                 {"op": "update_shop", "number": 6, "rating": 9},
+                 {"op": "fly"}]
+        results = await asyncio.gather(request(server.address, routes), request(server.address, edits),
+                                       request(server.address, [{"op": "top_rated", "k": 2}]))
+        await server.close()
+        return results
+
+    routes, edits, top = asyncio.run(scenario())
+    assert all(r["ok"] and r["path"] == [1, 3, 5] and r["distance"] == 110 for r in routes)
+    assert [r["id"] for r in routes] == list(range(10))
+    assert [r["ok"] for r in edits] == [True, True, True, False, False]
+    assert edits[2]["path"] == [6, 5, 3, 1]
+    assert edits[3]["error"] == "Rating should be between 1 and 5!"
+    assert [shop["number"] for shop in top[0]["shops"]] == [3, 5]
+
+def test_command_errors(setup_store, monkeypatch, capsys):
+    print("\nTelling bad commands apart from internal errors...")
+    store = setup_store
+    assert execute(store, {"op": "route", "source": 1}) == {"ok": False, "error": "Missing field: destination"}
+    assert execute(store, {"op": "add_shop", "number": 6, "name": "F", "id": 3})["error"] == "Missing field: category"
+    # Badly typed fields are the client's error too, and leave the store unchanged
+    bad_name = {"op": "add_shop", "number": 6, "name": 123, "category": "Toys", "location": "Annex", "rating": 3}
+    assert execute(store, bad_name) == {"ok": False, "error": "Shop name must be a string, got 123"}
+    assert not execute(store, {"op": "update_shop", "number": 1, "location": {"wing": "east"}})["ok"]
+    assert not store.graph.has_vertex(6) and store.get(1).location == "East"
+    assert execute(store, {**bad_name, "name": "ShopF"})["ok"]
+    # Switching metrics on or off needs the write lock; reading them does not
+    assert is_write({"op": "metrics", "enable": False}) and not is_write({"op": "metrics"})
+    # A KeyError raised by the store is a bug, not a missing field
+    monkeypatch.setattr(store.graph, "shortest_path", lambda *args: {}["boom"])
+    with pytest.raises(KeyError):
+        execute(store, {"op": "route", "source": 1, "destination": 5})
+
+    async def scenario():
+        server = ShopServer(store)
+        await server.start()
+        reader, writer = await asyncio.open_connection(*server.address)
+        responses = []
+        for command in ({"op": "route", "source": 1, "destination": 5, "id": 7}, {"op": "get_shop", "number": 1}):
+            writer.write(json.dumps(command).encode() + b"\n")
+            await writer.drain()
+            responses.append(json.loads(await reader.readline()))
+        writer.close()
+        await writer.wait_closed()
+        await server.close()
+        return responses
+
+    failed, served = asyncio.run(scenario())
+    # The server reports and logs the bug, and the connection keeps working
+    assert failed == {"ok": False, "error": "Internal error: KeyError: 'boom'", "id": 7}
+    assert "KeyError" in capsys.readouterr().err
+    assert served["ok"] and served["shop"]["number"] == 1
+
+def test_batch_mode(capsys):
+    print("\nReplaying a batch of commands without prompts...")
+    app = MainApp()
+    app.load_data("./shops.csv", "./edges.csv")
+    commands = io.StringIO("\n".join([
+        '{"op": "add_shop", "number": 6, "name": "ShopF", "category": "Toys", "location": "Northeast", "rating": 4}',
+        '{"op": "add_connection", "source": 6, "destination": 4}',
+        '',
+        '{"op": "route", "source": 6, "destination": 1, "method": "bfs"}',
+        '{"op": "delete_shop", "number": 42}',
+        'not json',
+        '{"op": "add_shop", "number": 7, "name": 7, "category": "Toys", "location": "Northeast", "rating": 4}',
+        '{"op": "search", "category": "Toys"}',
+    ]))
+    results = io.StringIO()
+    capsys.readouterr()
+    failed = app.run_batch(commands, results)
+    assert capsys.readouterr().out == ""
+    lines = [json.loads(line) for line in results.getvalue().splitlines()]
+    assert failed == 3
+    assert [line["line"] for line in lines] == [1, 2, 4, 5, 6, 7, 8]
+    assert lines[2]["path"] == [6, 4, 2, 1]
+    assert lines[3]["error"] == "Shop 42 doesn't exist!"
+    assert lines[5]["error"] == "Shop name must be a string, got 7"
+    assert [shop["name"] for shop in lines[6]["shops"]] == ["ShopF"]
+
+def test_generate_mall_layouts():
+    print("\nGenerating synthetic malls...")
+    for layout in ("grid", "multifloor", "random"):
+        shops, edges = generate_mall(200, layout, floors=4, categories=5, ratings="skewed", seed=3)
+        graph = Graph()
+        for shop in shops:
+            graph.add_vertex(shop)
+        for source, destination, weight in edges:
+            graph.add_edge(source, destination, weight)
+        print(f"-> {layout}: {len(shops)} shops, {len(edges)} edges")
+        assert len(shops) == 200
+        assert len({shop.category for shop in shops}) <= 5
+        assert all(1 <= shop.rating <= 5 for shop in shops)
+        # Every layout is connected
+        assert len(graph.routes_from(0, method="bfs").prev_nodes) == 200
+        # Corridors are never shorter than the straight line, so A* finds optimal routes
+        for start, end in [(0, 199), (17, 150), (42, 43), (99, 5)]:
+            assert graph.path_cost(graph.shortest_path(start, end, "astar")) == \
+                graph.path_cost(graph.shortest_path(start, end))
+    assert generate_mall(50, seed=1)[1] == generate_mall(50, seed=1)[1]
 
+def test_run_benchmark():
+    print("\nRunning a tiny benchmark...")
+    result = run_benchmark(100, "multifloor", queries=3)
+    print(f"-> {json.dumps(result)}")
+    assert result["shops"] == 100
+    assert set(result["results"]) >= {"load", "bfs", "dfs", "shortest_path", "remove_vertex",
+                                      "hashtable_search", "hashtable_update", "heap_rebuild"}
+    assert result["results"]["bfs"]["ops"] == 3
 
+def test_metrics_recording(setup_store, tmp_path):
+    print("\nRecording hot-path metrics...")
+    assert metrics.snapshot() == {}
+    metrics.enable()
+    try:
+        setup_store.graph.bfs(1, 5)
+        setup_store.graph.dfs(1, 5)
+        setup_store.graph.shortest_path(4, 5)
+        list(setup_store.shop_table.iter_search("Books"))
+        setup_store.update(4, rating=5)
+        setup_store.shop_heap.rebuild_heap(list(setup_store.graph.shops.values()))
+        snapshot = metrics.snapshot()
+        print(f"-> {json.dumps(snapshot)}")
+        histograms = snapshot["histograms"]
+        assert histograms["graph.bfs.path_length"]["max"] == 3
+        assert histograms["graph.shortest_path.dijkstra.path_length"]["count"] == 1
+        assert histograms["graph.dfs.nodes_visited"]["count"] == 1
+        assert histograms["hashtable.bucket_size"]["max"] == 1
+        assert histograms["heap.size"]["max"] == 5
+        assert snapshot["counters"] == {"hashtable.updates": 1, "heap.priority_updates": 1, "heap.rebuilds": 1}
+        metrics.dump(tmp_path / "metrics.json")
+        assert json.loads((tmp_path / "metrics.json").read_text()) == json.loads(json.dumps(snapshot))
+    finally:
+        metrics.disable()
+    setup_store.graph.bfs(1, 4)
+    assert metrics.snapshot() == {}
 
+def test_component_index(setup_graph):
+    print("\nAnswering unreachable routes from the component index...")
+    graph = setup_graph
+    graph.add_vertex(Shop(6, "Kiosk", "Food", "Annex", 4))
+    graph.add_vertex(Shop(7, "Cart", "Food", "Annex", 3))
+    assert len(graph.components) == 3
+    assert not graph.connected(1, 6)
+    assert graph.bfs(1, 6) == [] and graph.dfs(1, 6) == [] and graph.shortest_path(1, 6, "astar") == []
+    graph.add_edge(6, 7)
+    graph.add_edge(5, 6)
+    assert graph.connected(1, 7) and len(graph.components) == 1
+    assert graph.distance_matrix([7], [1, 6]) == [[graph.path_cost(graph.shortest_path(7, 1)), 1]]
+    # Only a removal that really splits a component rebuilds the index
+    rebuilds = graph.components.rebuilds
+    graph.remove_edge(1, 2)
+    assert graph.connected(1, 4) and graph.components.rebuilds == rebuilds
+    graph.remove_edge(5, 6)
+    assert not graph.connected(4, 7) and graph.components.rebuilds == rebuilds + 1
+    assert graph.components.component_size(1) == 5 and graph.components.component_size(7) == 2
+    graph.remove_vertex(3)
+    graph.add_vertex(Shop(3, "Back again", "Clothing", "North", 2))
+    assert not graph.connected(1, 3) and not graph.connected(1, 5)
+    assert graph.routes_from(2, [4, 3, 6]).path(4) == [2, 4] and len(graph.components) == 5
+    frozen = graph.freeze()
+    assert frozen.connected(6, 7) and not frozen.connected(1, 6)
+    assert frozen.bfs(1, 7) == [] and frozen.shortest_path(6, 7) == [6, 7]
 
+def test_component_index_removes_adjacent_shops(setup_graph):
+    print("\nRemoving neighbouring shops one after another...")
+    graph = setup_graph
+    cache = graph.enable_route_cache()
+    graph.bfs(5, 4)
+    # Each removal leaves the next shop isolated but linked to ghosts in the forest
+    for number in (2, 1, 3, 5):
+        graph.remove_vertex(number)
+        assert number not in graph.adj_list and not cache.vertex_index.get(number)
+    assert list(graph.adj_list) == [4] and len(graph.components) == 1
+    assert graph.components.component_size(4) == 1
+    small = Graph()
+    small.add_vertex(Shop(1, "ShopA", "Food", "East", 4))
+    small.add_vertex(Shop(2, "ShopB", "Food", "West", 3))
+    small.add_edge(2, 1)
+    small.remove_vertex(2)
+    small.remove_vertex(1)
+    assert len(small.components) == 0 and small.components.parent == {}
 
+def test_component_index_concurrent_readers():
+    print("\nQuerying routes from several threads after an edge removal...")
+    shops, edges = generate_mall(2500, seed=4)
+    graph = Graph()
+    for shop in shops:
+        graph.add_vertex(shop)
+    for source, destination, weight in edges:
+        graph.add_edge(source, destination, weight)
+    graph.remove_edge(0, 1)
+    graph.remove_vertex(60)
+    forest = dict(graph.components.parent)
+    rng = random.Random(4)
+    pairs = [(rng.randrange(2500), rng.randrange(2500)) for _ in range(200)]
+    pairs = [(a, b) for a, b in pairs if 60 not in (a, b)] + [(0, 2499)]
+    expected = [graph.bfs(a, b) for a, b in pairs]
+    with ThreadPoolExecutor(8) as executor:
+        found = list(executor.map(lambda pair: graph.bfs(*pair), pairs))
+    assert found == expected and all(expected)
+    # Reads never touch the forest
+    assert graph.components.parent == forest
+
+def test_nearest_by_category(setup_store):
+    print("\nFinding the nearest shops of a category...")
+    store = setup_store
+    store.add(Shop(6, "Food Court", "Food", "Center", 4))
+    store.add(Shop(7, "Snack Bar", "Food", "Annex", 3))
+    store.connect(5, 6, 10)
+    nearest = store.nearest(1, "Food", k=2)
+    print(f"-> {nearest}")
+    # Shop 4 is 95 away via shop 2; the food court is 120 away via shops 3 and 5
+    assert nearest == [(4, 95, [1, 2, 4]), (6, 120, [1, 3, 5, 6])]
+    assert store.nearest(1, "Food", k=3) == nearest  # the snack bar is unreachable
+    assert store.nearest(4, "Food") == [(4, 0, [4])]
+    assert [number for number, _, _ in store.nearest(1, "Food", k=2, method="bfs")] == [4, 6]
+    assert store.nearest(1, "Toys") == []
+    # Without a category index every visited shop is checked
+    assert store.graph.nearest(1, "Food", k=2) == nearest
+    assert store.graph.freeze().nearest(1, "Food", k=2, candidates=[4, 6, 7]) == nearest
+    response = execute(store, {"op": "nearest", "source": 1, "category": "Food"})
+    assert response["shops"][0]["number"] == 4 and response["shops"][0]["distance"] == 95
+
+def test_nearest_stops_at_component(setup_store):
+    print("\nFinding shops of a category that are out of reach...")
+    store = setup_store
+    # Many food shops, none of them reachable from shop 1
+    for number in range(10, 2010):
+        store.add(Shop(number, f"Kiosk{number}", "Food", "Annex", 3))
+        if number > 10:
+            store.connect(number - 1, number, 5)
+    metrics.enable()
+    try:
+        assert store.nearest(1, "Food", k=3) == [(4, 95, [1, 2, 4])]
+        assert store.graph.freeze().nearest(1, "Food", k=3, candidates=range(10, 2010)) == []
+        histograms = metrics.snapshot()["histograms"]
+        # Only the five shops around shop 1 are searched
+        assert histograms["graph.nearest.dijkstra.nodes_visited"]["max"] == 5
+    finally:
+        metrics.disable()
+    assert [number for number, _, _ in store.nearest(2009, "Food", k=2)] == [2009, 2008]
+
+def test_name_search(setup_store):
+    print("\nSearching shops by name...")
+    store = setup_store
+    store.add(Shop(6, "Shoe Palace", "Clothing", "West", 4))
+    store.add(Shop(7, "Cafe Shore", "Food", "East", 5))
+    # Prefix matches come back highest rated first
+    assert [shop.number for shop in store.autocomplete("shop")] == [3, 5, 1, 2, 4]
+    assert [shop.number for shop in store.autocomplete("sho", limit=3)] == [3, 5, 1]
+    assert [shop.number for shop in store.autocomplete("  SHOE p")] == [6]
+    # Typos still find the shop
+    assert [shop.number for shop in store.find_by_name("Shoe Palase")] == [6]
+    assert [shop.number for shop in store.find_by_name("cafe shor")] == [7]
+    # The closest name wins over a higher rating
+    assert [shop.number for shop in store.find_by_name("ShopA")][:2] == [1, 3]
+    # Renaming and removing keep the index in sync
+    store.update(6, name="Boot Palace")
+    assert store.autocomplete("shoe") == [] and store.autocomplete("boot")[0].number == 6
+    store.remove(7)
+    assert store.find_by_name("cafe shore") == []
+    assert sorted(store.name_index.entries) == [1, 2, 3, 4, 5, 6]
+    response = execute(store, {"op": "search_name", "text": "Bot Palace", "fuzzy": True})
+    assert [shop["number"] for shop in response["shops"]] == [6]
+
+def test_name_index_after_load(tmp_path):
+    shops, edges = generate_mall(200, seed=3)
+    store = ShopStore()
+    errors = store.load_csv(*write_csv(shops, edges, tmp_path))
+    assert errors == [] and len(store.name_index) == 200
+    assert [shop.number for shop in store.autocomplete("shop19", limit=None)] == \
+        [shop.number for shop in store.shop_heap.sort_shops([shops[19]] + shops[190:200])]
+    assert store.find_by_name("shop 123", min_similarity=0.7)[0].number == 123
+
+def test_name_search_scale(tmp_path):
+    print("\nSearching names in a large mall...")
+    shops, edges = generate_mall(20000, seed=5)
+    store = ShopStore()
+    store.load_csv(*write_csv(shops, edges, tmp_path))
+    heap_order = {shop.number: i for i, shop in enumerate(store.shop_heap.sort_shops(shops))}
+    metrics.enable()
+    try:
+        for prefix in ("shop1", "shop", "Shop123", "shop1999"):
+            expected = sorted((shop for shop in shops if shop.name.lower().startswith(prefix.lower())),
+                              key=lambda shop: heap_order[shop.number])[:10]
+            assert store.autocomplete(prefix) == expected
+        for text in ("Shop12345", "shop 1234", "Shp1999"):
+            query = trigrams(normalize(text))
+            similarity = {shop.number: 2 * len(query & trigrams(normalize(shop.name))) /
+                          (len(query) + len(trigrams(normalize(shop.name)))) for shop in shops}
+            expected = sorted((number for number in similarity if similarity[number] >= 0.5),
+                              key=lambda number: (-similarity[number], heap_order[number]))[:10]
+            assert [shop.number for shop in store.find_by_name(text)] == expected
+        histograms = metrics.snapshot()["histograms"]
+        print(f"-> {histograms['store.autocomplete.scanned']} {histograms['nameindex.fuzzy.scored']}")
+        # Neither lookup goes through every shop sharing the prefix or the common trigrams
+        assert histograms["store.autocomplete.scanned"]["max"] < 200
+        assert histograms["nameindex.fuzzy.scored"]["max"] < 200
+    finally:
+        metrics.disable()
+
+def test_k_shortest_paths(setup_graph):
+    print("\nListing alternative routes...")
+    graph = setup_graph
+    routes = graph.k_shortest_paths(1, 5, k=3)
+    print(f"-> {[(route, graph.path_cost(route)) for route in routes]}")
+    # Only two loopless routes reach shop 5, both through shop 3
+    assert routes == [[1, 3, 5], [1, 2, 3, 5]]
+    graph.add_vertex(Shop(6, "ShopF", "Toys", "Annex", 3))
+    graph.add_edge(4, 6, 20)
+    graph.add_edge(6, 5, 20)
+    routes = graph.k_shortest_paths(1, 5, k=4)
+    assert [graph.path_cost(route) for route in routes] == [110, 115, 135, 190]
+    assert routes[2] == [1, 2, 4, 6, 5]
+    assert graph.k_shortest_paths(1, 5, k=2, method="bfs") == [[1, 3, 5], [1, 2, 3, 5]]
+    assert graph.k_shortest_paths(1, 1) == [[1]]
+    graph.add_vertex(Shop(7, "ShopG", "Toys", "Annex", 3))
+    assert graph.k_shortest_paths(1, 7) == []
+    with pytest.raises(ValueError):
+        graph.k_shortest_paths(1, 5, k=0)
+
+def test_congestion_profiles(tmp_path):
+    print("\nRouting with hourly congestion profiles...")
+    hours = [f"h{hour}" for hour in range(24)]
+    rush = ["1"] * 17 + ["2"] + ["1"] * 6
+    edges_path = tmp_path / "edges.csv"
+    with open(edges_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["source", "destination", "weight"] + hours)
+        writer.writerow([1, 2, 40] + [""] * 24)
+        writer.writerow([1, 3, 65] + rush)
+        writer.writerow([2, 3, 30] + [""] * 24)
+        writer.writerow([2, 4, 55] + ["1"] * 23 + ["0"])
+        writer.writerow([2, 4, 55] + [""] * 24)
+        writer.writerow([3, 5, 45] + [""] * 24)
+    store = ShopStore(cache_routes=True)
+    errors = store.load_csv("shops.csv", edges_path)
+    assert len(errors) == 1 and "multipliers must be positive numbers" in errors[0]
+    graph = store.graph
+    assert len(graph.congestion) == 1 and graph.congestion.get(3, 1)[17] == 2
+
+    morning, rush_hour = datetime.datetime(2026, 10, 18, 9), datetime.datetime(2026, 10, 18, 17, 30)
+    assert graph.shortest_path_at(1, 5, morning) == [1, 3, 5]
+    assert graph.shortest_path_at(1, 5, rush_hour) == [1, 2, 3, 5]
+    assert graph.path_cost_at([1, 3, 5], rush_hour) == 175 and graph.path_cost_at([1, 2, 3, 5], rush_hour) == 115
+    # Later queries in the same hour come from the cache
+    hits = graph.route_cache.hits
+    assert graph.shortest_path_at(1, 5, datetime.time(17, 5)) == [1, 2, 3, 5]
+    assert graph.route_cache.hits == hits + 1
+    response = execute(store, {"op": "route", "source": 1, "destination": 5, "at": "17:45"})
+    assert response["path"] == [1, 2, 3, 5] and response["walking_time"] == 115
+    # Changing a profile drops the timed routes
+    assert execute(store, {"op": "set_congestion", "source": 1, "destination": 3, "multipliers": [1] * 24})["ok"]
+    assert graph.shortest_path_at(1, 5, rush_hour) == [1, 3, 5]
+    assert not execute(store, {"op": "set_congestion", "source": 1, "destination": 3, "multipliers": [1]})["ok"]
+    with pytest.raises(ValueError):
+        graph.set_congestion(1, 5, rush)
+    graph.remove_edge(1, 3)
+    assert (1, 3) not in graph.congestion
+    # Frozen graphs, snapshots and thawed graphs keep the profiles
+    graph.set_congestion(2, 3, [1] * 17 + [4] + [1] * 6)
+    graph.add_edge(4, 5, 60)
+    path = tmp_path / "mall.snapshot"
+    save_snapshot(path, graph, store.shop_table, store.shop_heap)
+    loaded, _, _ = load_snapshot(path)
+    for other in (graph.freeze(), loaded, loaded.thaw()):
+        assert other.shortest_path_at(1, 5, rush_hour) == graph.shortest_path_at(1, 5, rush_hour) == [1, 2, 4, 5]
+        assert other.shortest_path_at(1, 5, morning) == graph.shortest_path_at(1, 5, morning) == [1, 2, 3, 5]
+        assert other.path_cost_at([1, 2, 3, 5], rush_hour) == graph.path_cost_at([1, 2, 3, 5], rush_hour) == 205
+        assert other.path_cost_at([1, 2, 4, 5], rush_hour) == 155
+        assert other.congestion.get(2, 3) == graph.congestion.get(2, 3)
+    # A frozen graph keeps its own copy of the profiles
+    frozen = graph.freeze()
+    graph.set_congestion(2, 3, None)
+    graph.remove_edge(2, 4)
+    assert frozen.shortest_path_at(1, 5, rush_hour) == [1, 2, 4, 5] and frozen.path_cost_at([1, 2, 3, 5], rush_hour) == 205
+
+def test_heap_insert_many_rejects_duplicates():
+    print("\nRejecting a batch with a duplicate shop number...")
+    heap = ShopHeap()
+    shops = [Shop(1, "A", "Food", "North", 4), Shop(2, "B", "Food", "North", 3), Shop(1, "C", "Toys", "East", 5)]
+    with pytest.raises(ValueError):
+        heap.insert_many(shops)
+    assert len(heap) == 0 and heap.positions == {} and heap.categories == {}
+    heap.insert_many(shops[:2])
+    with pytest.raises(ValueError):
+        heap.insert_many([Shop(3, "D", "Food", "West", 2), shops[1]])
+    assert len(heap) == 2 and 3 not in heap
+    heap.remove(1)
+    assert heap.top_k(5) == [shops[1]]
+
+def test_store_apply_batch_malformed_edits(setup_store):
+    print("\nApplying a batch with malformed edits...")
+    store = setup_store
+    errors = store.apply_batch([
+        ("add", Shop(6, "ShopF", "Toys", "Annex", 3)),
+        ("add", None),
+        ("remove", 1, 2),
+        "remove",
+        ("update", 2, None),
+        ("add", Shop(7, "ShopG", "Toys", "Annex", 4)),
+    ])
+    assert [error.split(":")[0] for error in errors] == ["edit 1", "edit 2", "edit 3", "edit 4"]
+    for number in (6, 7):
+        assert number in store.shop_heap and number in store.shop_table.entries and number in store.name_index
+
+    def edits():
+        yield ("add", Shop(8, "ShopH", "Toys", "Annex", 2))
+        raise RuntimeError("source failed")
+    with pytest.raises(RuntimeError):
+        store.apply_batch(edits())
+    # The shop already added to the graph still reached the other indexes
+    assert store.graph.has_vertex(8) and 8 in store.shop_heap and 8 in store.shop_table.entries
+
+def test_store_rejects_badly_typed_fields(setup_store):
+    print("\nRejecting shops and updates with badly typed fields...")
+    store = setup_store
+    store.name_index
+    for shop in (Shop(6, "ShopF", ["Toys"], "Annex", 3), Shop(6, 123, "Toys", "Annex", 3),
+                 Shop(6, "ShopF", "Toys", "Annex", 3, x="east")):
+        with pytest.raises(ValueError):
+            store.add(shop)
+        assert not store.graph.has_vertex(6) and 6 not in store.shop_heap
+    store.add(Shop(6, "ShopF", "Toys", "Annex", 3))
+    for changes in ({"location": {"wing": "east"}}, {"name": 123}, {"rating": True}, {"y": "north"}):
+        with pytest.raises(ValueError):
+            store.update(1, **changes)
+    shop = store.get(1)
+    assert shop.name == "ShopA" and shop.location == "East" and 1 in store.shop_table.entries
+    assert [s.number for s in store.find_by_name("ShopA", limit=1)] == [1]
+    errors = store.apply_batch([("add", Shop(7, 7, "Toys", "Annex", 3))])
+    assert len(errors) == 1 and not store.graph.has_vertex(7)
+
+def test_store_remove_shop_missing_from_table(setup_store):
+    store = setup_store
+    store.shop_table.delete(store.get(4))
+    assert store.remove(4).number == 4
+    assert not store.graph.has_vertex(4) and 4 not in store.shop_heap
+
+def test_rejects_non_finite_walking_distances(tmp_path):
+    print("\nRejecting NaN and infinite walking distances...")
+    edges_path = tmp_path / "edges.csv"
+    edges_path.write_text("source,destination,weight\n1,2,nan\n1,3,inf\n2,3,-5\n1,3,65\n")
+    graph = Graph()
+    errors = graph.load_csv("shops.csv", edges_path)
+    assert len(errors) == 3 and all("must be a positive number" in error for error in errors)
+    assert graph.shortest_path(1, 3) == [1, 3] and not graph.connected(1, 2)
+    for weight in (float("nan"), float("inf"), 0):
+        with pytest.raises(ValueError):
+            graph.add_edge(1, 2, weight)
+    with pytest.raises(ValueError):
+        graph.set_congestion(1, 3, [float("inf")] * 24)
 